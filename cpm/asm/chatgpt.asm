@@ -18,6 +18,7 @@ REGSELPORT  EQU     01h
 VALIDBIT    EQU     10h
 ACKBIT      EQU     20h
 
+STX         EQU     02h
 EOT         EQU     04h
 BSLASH      EQU     5Ch
 
@@ -64,6 +65,10 @@ START:
             CALL    SEND_Z
             CALL    READ_STRING
 
+            LD      DE,STR_COMPRESS
+            CALL    SEND_Z
+            CALL    READ_STRING
+
 CHAT_LOOP:
             LD      DE,STR_PROMPT
             CALL    PRINT_Z
@@ -89,8 +94,11 @@ CHAT_LOOP:
             CALL    PRINT_Z
 
             CALL    DELAY_SHORT
+            LD      A,STX
+            CALL    WAIT_FOR_CHAR                   ; status line
+            CALL    LZSS_BODY                       ; compressed body
             LD      A,EOT
-            CALL    WAIT_FOR_CHAR
+            CALL    WAIT_FOR_CHAR_INP
             JP      CHAT_LOOP
 
 
@@ -292,11 +300,14 @@ READ_STRING_INP:                            ; sometimes we want to read the stri
 .RS_DONE:
             RET
 
-WAIT_FOR_CHAR: ; A = target char (used for EOT)
-            LD      (WAITCHAR),A
+WAIT_FOR_CHAR: ; A = target char (used for STX and EOT)
+            PUSH    AF
             CALL    GPIO_INPUT
             LD      DE,STR_RX
             CALL    PRINT_Z
+            POP     AF
+WAIT_FOR_CHAR_INP:                          ; continue reading a response already started
+            LD      (WAITCHAR),A
 .WFC_LOOP:
             CALL    READ_BYTE
             LD      B,A
@@ -587,6 +598,8 @@ STR_HDRS_OFF:
 
 STR_JSONPATH_CHAT:
             DB      'RESPONSE JSONPATH $.output[1].content[0].text',13,10,0
+STR_COMPRESS:
+            DB      'COMPRESS LZSS',13,10,0
 STR_POST_START:
             DB      'POST /v1/responses HTTP/1.1',13,10,13,10
             DB      '{ "model": "gpt-5-nano", "input": "',0
@@ -595,4 +608,6 @@ STR_POST_END:
 
 STR_QUIT:    DB     '/QUIT',0
 
+            INCLUDE "lzss.inc"
+
             END
\ No newline at end of file
@@ -0,0 +1,295 @@
+# ------------------------
+# Benchmarks
+# ------------------------
+#
+# Drives the simulated proxy over each link model against the stand-in
+# server, and saves the results as JSON to compare one commit with another.
+#
+#   python host/bench.py [-o results.json] [--compare old.json]
+#                        [--links uart,gpio-8bit] [--scenarios small-json,jsonpath]
+#                        [-n iterations]
+#
+# Each link model runs in its own process, as the proxy only starts once per
+# process. For every scenario and link the results hold the medians of:
+#
+#   ttfb_ms         request sent to the first byte of the response
+#   total_ms        request sent to the end of the response (EOT)
+#   bytes           bytes the client received, status line to EOT
+#   bytes_per_s     bytes over total_ms
+#   upstream_ms     the same request made straight to the server
+#   overhead_ms     total_ms less upstream_ms, what the proxy and link add
+#   peak_heap       most Python heap allocated during one request (tracemalloc),
+#                   the proxy's and the link's. gc.mem_alloc() on a device
+#
+# HTTPS scenarios need the openssl command, for a certificate the simulated
+# proxy is told to trust through SSL_CERT_FILE. Without it they're skipped.
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import select
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+EOT = 0x04
+TIMEOUT = 120       # Longest one response may take, seconds
+
+GPIO = ["VALID_PIN=8", "ACK_PIN=9", "LATENCY_US=20", "TIMEOUT_MS=0"]
+
+# Link model -> env file lines for the simulator
+LINKS = {
+    "loopback": ["MODE=loopback", "BAUD=0"],
+    "uart": ["MODE=loopback", "BAUD=115200"],
+    "gpio-8bit": ["MODE=gpio-8bit", "DATA_PINS=0,1,2,3,4,5,6,7", "MIN_HOLD_TIME_MS=1"] + GPIO,
+    # Shorter holds race the simulated peer at turnaround
+    "gpio-4bit": ["MODE=gpio-4bit", "DATA_PINS=0,1,2,3", "MIN_HOLD_TIME_MS=5"] + GPIO,
+}
+
+# Size of the large bodies. The simulated GPIO peer moves about 1 KB/s
+LARGE = {"loopback": 16384, "uart": 16384, "gpio-8bit": 4096, "gpio-4bit": 2048}
+
+# Scenario -> (scheme, commands sent first, path). The commands are undone
+# with RESPONSE JSONPATH afterwards
+SCENARIOS = {
+    "small-json": ("http", [], "/json"),
+    "large-body": ("http", [], "/data?size={large}"),
+    "gzip-body": ("http", [], "/data?size={large}&gzip=1"),
+    "chunked": ("http", [], "/data?size={large}&chunked=1"),
+    "jsonpath": ("http", ["RESPONSE JSONPATH $.items[*].name"], "/data?size={large}"),
+    "redirect": ("http", [], "/redirect?n=2&to=/json"),
+    "https-json": ("https", [], "/json"),
+    "https-large": ("https", [], "/data?size={large}"),
+}
+
+
+# ------------------------
+# Client side, in the link's process
+# ------------------------
+
+class Client:
+    """Sends commands and requests over the client end of a Link"""
+
+    def __init__(self, link):
+        self.link = link
+        self.buf = bytearray(4096)  # Read into, so reading adds nothing to the heap
+
+    def command(self, line):
+        self.link.write(line.encode() + b"\r\n")
+        reply = self.link.read_until(b"\r\n", TIMEOUT)
+        if not reply.startswith(b"OK"):
+            raise RuntimeError(f"{line}: {reply!r}")
+
+    def request(self, path):
+        """Returns (ttfb, total, bytes) for one GET, times in seconds"""
+        start = time.perf_counter()
+        self.link.write(f"GET {path} HTTP/1.1\r\n\r\n".encode())
+        first = None
+        received = 0
+        head = b""
+        deadline = start + TIMEOUT
+        fd = self.link.client_rx
+        while True:
+            if not select.select([fd], [], [], max(0, deadline - time.perf_counter()))[0]:
+                raise TimeoutError(f"GET {path}: {received} bytes in {TIMEOUT}s")
+            n = os.readv(fd, [self.buf])
+            if first is None:
+                first = time.perf_counter()
+            received += n
+            if len(head) < 256:
+                head += self.buf[:min(n, 256 - len(head))]
+                if head.startswith(b"SLAPI/1.0") and b"\r\n" in head:
+                    raise RuntimeError(f"GET {path}: {head.splitlines()[0].decode()}")
+            if EOT in memoryview(self.buf)[:n]:
+                return first - start, time.perf_counter() - start, received
+
+
+def fetch(conn, path):
+    """Time one GET straight to the server on conn, following redirects"""
+    start = time.perf_counter()
+    while True:
+        # What the proxy asks for, on a kept connection as the proxy's are
+        conn.request("GET", path, headers={"Accept-Encoding": "gzip, deflate"})
+        response = conn.getresponse()
+        response.read()
+        location = response.getheader("Location")
+        if response.status not in (301, 302, 303, 307, 308) or not location:
+            return time.perf_counter() - start
+        path = location
+
+
+def measure(client, scheme, port, commands, path, iterations):
+    for line in commands:
+        client.command(line)
+    client.request(path)    # Warm the DNS cache and connection pool
+    runs = [client.request(path) for _ in range(iterations)]
+    if scheme == "https":
+        conn = http.client.HTTPSConnection("127.0.0.1", port, timeout=TIMEOUT)
+    else:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=TIMEOUT)
+    fetch(conn, path)
+    upstream = statistics.median(fetch(conn, path) for _ in range(iterations))
+    conn.close()
+
+    tracemalloc.start()
+    client.request(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    if commands:
+        client.command("RESPONSE JSONPATH")
+    ttfb, total, received = (statistics.median(values) for values in zip(*runs))
+    return {
+        "ttfb_ms": round(ttfb * 1000, 2),
+        "total_ms": round(total * 1000, 2),
+        "bytes": int(received),
+        "bytes_per_s": round(received / total),
+        "upstream_ms": round(upstream * 1000, 2),
+        "overhead_ms": round((total - upstream) * 1000, 2),
+        "peak_heap": peak,
+    }
+
+
+def run_link(name, ports, scenarios, iterations):
+    """Run the scenarios on one link model, in this process"""
+    sys.path.insert(0, HOST_DIR)
+    import sim
+    client = Client(sim.start(LINKS[name] + ["SSID=bench", "PASSWORD=bench", "LINK=pipe"]))
+    results = {}
+    for scenario in scenarios:
+        scheme, commands, path = SCENARIOS[scenario]
+        port = ports[scheme]
+        client.command(f"DOMAIN {scheme}://127.0.0.1:{port}")
+        path = path.format(large=LARGE[name])
+        results[scenario] = measure(client, scheme, port, commands, path, iterations)
+    return results
+
+
+# ------------------------
+# Runner
+# ------------------------
+
+def certificate(folder):
+    """Self-signed certificate for 127.0.0.1, (certfile, keyfile) or None"""
+    cert = os.path.join(folder, "cert.pem")
+    key = os.path.join(folder, "key.pem")
+    try:
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+             "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+             "-keyout", key, "-out", cert],
+            check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return cert, key
+
+
+def commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HOST_DIR,
+                             check=True, capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def run_links(folder, links, scenarios, iterations):
+    """Run each link model in a child process, returns link -> results"""
+    import standin
+    ports = {"http": standin.start().server_port}
+    env = dict(os.environ)
+    tls = certificate(folder)
+    if tls:
+        ports["https"] = standin.start(certfile=tls[0], keyfile=tls[1]).server_port
+        env["SSL_CERT_FILE"] = tls[0]
+    else:
+        print("No openssl, skipping HTTPS scenarios", file=sys.stderr)
+        scenarios = [s for s in scenarios if SCENARIOS[s][0] != "https"]
+
+    results = {}
+    for name in links:
+        print(f"{name}...", file=sys.stderr)
+        out = os.path.join(folder, f"{name}.json")
+        # The proxy logs everything it sends to stderr, and prints to stdout
+        with tempfile.TemporaryFile() as log:
+            child = subprocess.run(
+                [sys.executable, __file__, "--child", name, "--ports", json.dumps(ports),
+                 "--scenarios", ",".join(scenarios), "-n", str(iterations), "-o", out],
+                env=env, stdout=log, stderr=log)
+            if child.returncode:
+                log.seek(0)
+                sys.stderr.buffer.write(log.read()[-4000:])
+                raise SystemExit(f"{name} failed")
+        with open(out) as f:
+            results[name] = json.load(f)
+    return results
+
+
+def run(links, scenarios, iterations):
+    with tempfile.TemporaryDirectory() as folder:
+        results = run_links(folder, links, scenarios, iterations)
+    return {
+        "commit": commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "iterations": iterations,
+        "results": results,
+    }
+
+
+def report(run, baseline=None):
+    """Print a table, with the change in total time from a baseline of the same size"""
+    old = baseline["results"] if baseline else {}
+    print(f"{'link':<10} {'scenario':<12} {'ttfb ms':>9} {'total ms':>10} {'B/s':>9} {'overhead ms':>12} {'heap':>8}")
+    for link, scenarios in run["results"].items():
+        for scenario, r in scenarios.items():
+            line = (f"{link:<10} {scenario:<12} {r['ttfb_ms']:>9} {r['total_ms']:>10} "
+                    f"{r['bytes_per_s']:>9} {r['overhead_ms']:>12} {r['peak_heap']:>8}")
+            before = old.get(link, {}).get(scenario)
+            if before and before["bytes"] == r["bytes"] and before["total_ms"]:
+                line += f"  {(r['total_ms'] - before['total_ms']) * 100 / before['total_ms']:+.1f}% total"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SLAPI proxy benchmarks on the host simulator")
+    parser.add_argument("-o", "--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="results JSON from an earlier run to compare with")
+    parser.add_argument("--links", default=",".join(LINKS))
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("-n", "--iterations", type=int, default=3)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--ports", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(",")
+
+    if args.child:
+        results = run_link(args.child, json.loads(args.ports), scenarios, args.iterations)
+        with open(args.output, "w") as f:
+            json.dump(results, f)
+        os._exit(0)     # The proxy's thread serves forever
+
+    for name, known in (("link", LINKS), ("scenario", SCENARIOS)):
+        chosen = args.links.split(",") if name == "link" else scenarios
+        unknown = [c for c in chosen if c not in known]
+        if unknown:
+            parser.error(f"unknown {name}: {', '.join(unknown)}")
+    results = run(args.links.split(","), scenarios, args.iterations)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
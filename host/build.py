@@ -0,0 +1,55 @@
+# ------------------------
+# Device Build
+# ------------------------
+#
+# Compiles lib/ to .mpy bytecode with mpy-cross, so the board doesn't compile
+# every module from source each time it starts:
+#
+#   pip install mpy-cross
+#   python host/build.py [output folder, default build]
+#
+# Copy the output folder's files and a .env to the board in place of lib/.
+# main.py is copied as source, MicroPython only runs main.py itself. The
+# mpy-cross version must make .mpy files the firmware can load: mpy-cross
+# 1.23 for firmware 1.23, and so on.
+#
+# To freeze the modules into a firmware image instead, see manifest.py.
+
+import os
+import shutil
+import subprocess
+import sys
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(os.path.dirname(HOST_DIR), "lib")
+SOURCE_ONLY = ("main.py",)
+
+
+def mpy_cross():
+    """The mpy-cross command, from the PATH or the mpy-cross pip package"""
+    if shutil.which("mpy-cross"):
+        return ["mpy-cross"]
+    try:
+        import mpy_cross   # noqa: F401, only to see that it is installed
+    except ImportError:
+        raise SystemExit("mpy-cross not found, pip install mpy-cross")
+    return [sys.executable, "-m", "mpy_cross"]
+
+
+def build(out):
+    command = mpy_cross()
+    os.makedirs(out, exist_ok=True)
+    for name in sorted(os.listdir(LIB_DIR)):
+        if not name.endswith(".py"):
+            continue
+        source = os.path.join(LIB_DIR, name)
+        if name in SOURCE_ONLY:
+            shutil.copy(source, os.path.join(out, name))
+            continue
+        target = os.path.join(out, name[:-3] + ".mpy")
+        subprocess.run(command + ["-o", target, "-s", name, source], check=True)
+        print(target)
+
+
+if __name__ == "__main__":
+    build(sys.argv[1] if len(sys.argv) > 1 else "build")
@@ -0,0 +1,122 @@
+# ------------------------
+# MicroPython Compatibility
+# ------------------------
+#
+# Adds the MicroPython functions the proxy uses to the CPython modules, so
+# the files in lib/ run unchanged on a host. machine, network and deflate
+# are separate modules in this folder.
+
+import asyncio
+import gc
+import socket
+import ssl
+import sys
+import time
+import traceback
+import tracemalloc
+
+_start = time.monotonic_ns()
+
+HEAP_SIZE = 256 * 1024  # gc.mem_free reports against a heap this size
+
+
+def ticks_ms():
+    return (time.monotonic_ns() - _start) // 1000000
+
+
+def ticks_us():
+    return (time.monotonic_ns() - _start) // 1000
+
+
+def print_exception(e, file=sys.stderr):
+    traceback.print_exception(type(e), e, e.__traceback__, file=file)
+
+
+def wrap_socket(sock, server_hostname=None, do_handshake=True):
+    """ssl.wrap_socket as MicroPython has it, verifying the server"""
+    return ssl.create_default_context().wrap_socket(
+        sock, server_hostname=server_hostname, do_handshake_on_connect=do_handshake)
+
+
+def write(sock, buf):
+    """sock.write as MicroPython has it, None when a non-blocking socket takes nothing"""
+    try:
+        return sock.send(buf)
+    except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+        return None
+
+
+def mem_alloc():
+    """Python heap in use, when tracemalloc is tracing, 0 otherwise"""
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+
+async def sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+# fd -> Future of the read waiting on it
+_waiting = {}
+
+
+def _wake(fd):
+    ready = _waiting.get(fd)
+    if ready is not None and not ready.done():
+        ready.set_result(None)
+
+
+class StreamReader:
+    """asyncio.StreamReader(sock) as MicroPython has it, for a non-blocking socket"""
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    async def readinto(self, buf):
+        loop = asyncio.get_running_loop()
+        fd = self.sock.fileno()
+        while True:
+            try:
+                return self.sock.recv_into(buf)
+            except (BlockingIOError, ssl.SSLWantReadError):
+                pass
+            # Nothing yet, wait until the socket is readable
+            ready = loop.create_future()
+            _waiting[fd] = ready
+            # fd may be the number of a closed socket the selector still holds,
+            # registering afresh puts this socket in epoll
+            loop.remove_reader(fd)
+            loop.add_reader(fd, _wake, fd)
+            try:
+                await ready
+            finally:
+                # MicroPython drops a cancelled read at once, CPython only when
+                # the task next runs. By then another read may be waiting on fd
+                if _waiting.get(fd) is ready:
+                    del _waiting[fd]
+                    loop.remove_reader(fd)
+
+
+def install():
+    """Patch the standard modules, before anything from lib/ is imported"""
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    time.sleep_us = lambda us: time.sleep(us / 1000000)
+    time.ticks_ms = ticks_ms
+    time.ticks_us = ticks_us
+    time.ticks_add = lambda ticks, delta: ticks + delta
+    time.ticks_diff = lambda new, old: new - old
+    sys.modules["utime"] = time
+    sys.print_exception = print_exception
+    gc.mem_alloc = mem_alloc
+    gc.mem_free = lambda: HEAP_SIZE - mem_alloc()
+
+    socket.socket.readinto = socket.socket.recv_into
+    ssl.SSLSocket.readinto = ssl.SSLSocket.recv_into
+    socket.socket.write = write
+    ssl.SSLSocket.write = write
+    # CPython's own takes no server_hostname, and is gone from 3.12
+    ssl.wrap_socket = wrap_socket
+
+    asyncio.sleep_ms = sleep_ms
+    asyncio.StreamReader = StreamReader
+    # Gives the simulated peer a chance to run while the proxy polls a pin
+    sys.setswitchinterval(0.00005)
@@ -0,0 +1,45 @@
+# ------------------------
+# deflate, for the Host Simulator
+# ------------------------
+#
+# DeflateIO on top of zlib. Like MicroPython's, it pulls compressed input
+# from a stream as it needs it.
+
+import zlib
+
+AUTO = 0
+RAW = 1
+ZLIB = 2
+GZIP = 3
+
+_WBITS = {AUTO: 47, RAW: -15, ZLIB: 15, GZIP: 31}
+_IN_SIZE = 64
+
+
+class DeflateIO:
+    def __init__(self, stream, format=AUTO, wbits=0, close=False):
+        self.stream = stream
+        self.z = zlib.decompressobj(_WBITS[format])
+        self.out = b""
+        self.inbuf = bytearray(_IN_SIZE)
+
+    def readinto(self, buf):
+        while len(self.out) < len(buf) and not self.z.eof:
+            n = self.stream.readinto(self.inbuf)
+            if not n:
+                break
+            try:
+                self.out += self.z.decompress(bytes(self.inbuf[:n]))
+            except zlib.error:
+                raise OSError(22)
+        n = min(len(buf), len(self.out))
+        buf[:n] = self.out[:n]
+        self.out = self.out[n:]
+        return n
+
+    def read(self, size=-1):
+        buf = bytearray(size if size >= 0 else 4096)
+        return bytes(buf[:self.readinto(buf)])
+
+    def close(self):
+        pass
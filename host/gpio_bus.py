@@ -0,0 +1,147 @@
+# ------------------------
+# Simulated GPIO Bus
+# ------------------------
+#
+# The pins the proxy creates with machine.Pin are lines on one Bus. A Peer
+# thread plays the client's side of the VALID/ACK handshake (see GPIO
+# protocol.md), moving bytes between the bus and a Link. It waits `latency`
+# seconds before each edge it drives, standing in for a slow client polling
+# its port.
+
+import os
+import threading
+import time
+
+from link import waiting
+
+IN = 0
+OUT = 1
+
+POLL = 0.001        # Longest the peer waits on the bus before looking again
+TURNAROUND = 0.002  # The peer lets the proxy see VALID low before it sends
+
+
+class Bus:
+    """Line levels, and the direction the proxy has set each of its pins to"""
+
+    def __init__(self):
+        self.levels = {}
+        self.modes = {}
+        self.changed = threading.Condition()
+
+    def level(self, pin):
+        return self.levels.get(pin, 0)
+
+    def drive(self, pin, value):
+        self.levels[pin] = 1 if value else 0
+        with self.changed:
+            self.changed.notify_all()
+
+    def set_mode(self, pin, mode):
+        self.modes[pin] = mode
+        with self.changed:
+            self.changed.notify_all()
+
+
+bus = Bus()
+
+
+class Peer(threading.Thread):
+    """The client end of the handshake, in 8 or 4 bit mode"""
+
+    def __init__(self, link, data_pins, valid_pin, ack_pin, latency=0.0, bus=bus):
+        super().__init__(daemon=True)
+        self.link = link
+        self.data_pins = data_pins
+        self.valid = valid_pin
+        self.ack = ack_pin
+        self.latency = latency
+        self.bus = bus
+        self.width = len(data_pins)
+        self.bytes_in = 0       # Bytes taken from the proxy
+        self.bytes_out = 0      # Bytes given to the proxy
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _proxy_sending(self):
+        return self.bus.modes.get(self.valid) == OUT
+
+    def _wait(self, pin, value, sending):
+        """Wait for pin to reach value. False if the proxy turns the bus round first"""
+        with self.bus.changed:
+            while self.bus.level(pin) != value:
+                if self._proxy_sending() != sending:
+                    return False
+                self.bus.changed.wait(POLL)
+        return True
+
+    def _receive(self):
+        """Take one unit (byte or nibble) the proxy is sending, None if it stops"""
+        self.bus.drive(self.ack, 0)
+        if not self._wait(self.valid, 1, True):
+            return None
+        self._delay()
+        value = 0
+        for i, pin in enumerate(self.data_pins):
+            value |= self.bus.level(pin) << i
+        self.bus.drive(self.ack, 1)
+        self._wait(self.valid, 0, True)
+        self._delay()
+        self.bus.drive(self.ack, 0)
+        return value
+
+    def _send(self, value):
+        """Give one unit to the proxy, False if it turns the bus round first"""
+        if not self._wait(self.ack, 0, False):
+            return False
+        for i, pin in enumerate(self.data_pins):
+            self.bus.drive(pin, (value >> i) & 1)
+        self._delay()
+        self.bus.drive(self.valid, 1)
+        if not self._wait(self.ack, 1, False):
+            return False
+        self._delay()
+        self.bus.drive(self.valid, 0)
+        return True
+
+    def _units(self, byte):
+        if self.width == 8:
+            return (byte,)
+        return (byte >> 4, byte & 0x0F)
+
+    def run(self):
+        pending = b""
+        high = None
+        receiving = False
+        while True:
+            if self._proxy_sending():
+                receiving = True
+                value = self._receive()
+                if value is None:
+                    continue
+                if self.width == 4 and high is None:
+                    high = value
+                    continue
+                if high is not None:
+                    value = high << 4 | value
+                    high = None
+                os.write(self.link.proxy_tx, bytes((value,)))
+                self.bytes_in += 1
+                continue
+            if receiving:
+                # The proxy has turned the bus round, VALID is ours to drive
+                receiving = False
+                high = None
+                self.bus.drive(self.valid, 0)
+                time.sleep(TURNAROUND)
+            if not pending and waiting(self.link.proxy_rx):
+                pending = os.read(self.link.proxy_rx, 256)
+            if not pending:
+                with self.bus.changed:
+                    self.bus.changed.wait(POLL)
+                continue
+            if all(self._send(unit) for unit in self._units(pending[0])):
+                pending = pending[1:]
+                self.bytes_out += 1
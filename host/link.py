@@ -0,0 +1,71 @@
+# ------------------------
+# Client Link
+# ------------------------
+#
+# The byte channel between a client and the simulated proxy. A pipe link is
+# for a client in the same process, such as the benchmarks. A pty link gives
+# a /dev/pts path that a terminal program or emulator can open as its serial
+# port.
+
+import fcntl
+import os
+import pty
+import select
+import struct
+import termios
+import time
+import tty
+
+
+def waiting(fd):
+    """Bytes that can be read from fd without blocking"""
+    return struct.unpack("i", fcntl.ioctl(fd, termios.FIONREAD, b"\0\0\0\0"))[0]
+
+
+class Link:
+    """Two file descriptors each way, the proxy end and the client end"""
+
+    def __init__(self, proxy_rx, proxy_tx, client_rx, client_tx, name=None):
+        self.proxy_rx = proxy_rx
+        self.proxy_tx = proxy_tx
+        self.client_rx = client_rx
+        self.client_tx = client_tx
+        self.name = name            # Path for a client to open, pty links only
+
+    @classmethod
+    def pipe(cls):
+        to_proxy_r, to_proxy_w = os.pipe()
+        to_client_r, to_client_w = os.pipe()
+        return cls(to_proxy_r, to_client_w, to_client_r, to_proxy_w)
+
+    @classmethod
+    def pty(cls):
+        master, slave = pty.openpty()
+        # No echo or line editing, the client sees the bytes the proxy sends
+        tty.setraw(slave)
+        return cls(master, master, slave, slave, os.ttyname(slave))
+
+    # The client end, for a client in this process
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.client_tx, view):]
+
+    def read(self, size, timeout=None):
+        """Up to size bytes, b"" if none arrive within timeout seconds"""
+        if not select.select([self.client_rx], [], [], timeout)[0]:
+            return b""
+        return os.read(self.client_rx, size)
+
+    def read_until(self, marker, timeout=10):
+        """Read until marker has arrived, returns everything read"""
+        data = bytearray()
+        deadline = time.monotonic() + timeout
+        while marker not in data:
+            left = deadline - time.monotonic()
+            chunk = self.read(4096, left) if left > 0 else b""
+            if not chunk:
+                raise TimeoutError(f"No {marker!r} within {timeout}s")
+            data += chunk
+        return bytes(data)
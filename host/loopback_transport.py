@@ -0,0 +1,29 @@
+import sys
+
+import machine
+from link import Link
+from serial_transport import Serial
+
+# ------------------------
+# Loopback Transport
+# ------------------------
+#
+# The serial transport on a Link instead of a UART's pins. Everything above
+# machine.UART is the code that runs on the device. The client end is
+# transport.link.
+
+LOOPBACK_PORT = "loopback"
+
+
+class LoopbackTransport(Serial):
+    """Serial transport over a pipe (client in this process) or a pty"""
+
+    def __init__(self, kind="pipe", baudrate=0, **kwargs):
+        self.link = Link.pty() if kind == "pty" else Link.pipe()
+        machine.links[LOOPBACK_PORT] = self.link
+        if self.link.name:
+            print(f"Loopback link on {self.link.name}", file=sys.stderr)
+        super().__init__(LOOPBACK_PORT, baudrate=baudrate, **kwargs)
+
+    def __repr__(self):
+        return f"LoopbackTransport({self.link.name or 'pipe'}, baudrate={self.baudrate})"
@@ -0,0 +1,115 @@
+# ------------------------
+# machine, for the Host Simulator
+# ------------------------
+#
+# UART is carried on a Link, held to its baud rate the way a real UART's
+# TX buffer holds the writer back. Pins are lines on the simulated GPIO bus.
+
+import os
+import sys
+import time
+
+import gpio_bus
+from link import Link, waiting
+
+# UART id -> Link, a UART without one gets a pty
+links = {}
+
+
+class UART:
+    RTS = 1
+    CTS = 2
+
+    def __init__(self, id, baudrate=9600, bits=8, parity=None, stop=1, txbuf=256, **kwargs):
+        self.id = id
+        self.link = links.get(id)
+        if self.link is None:
+            self.link = links[id] = Link.pty()
+            print(f"UART {id} on {self.link.name}", file=sys.stderr)
+        self.txbuf = txbuf
+        self.done_at = 0.0          # When the last byte written leaves the wire
+        self.init(baudrate, bits, parity, stop)
+
+    def init(self, baudrate=9600, bits=8, parity=None, stop=1, **kwargs):
+        """A baudrate of 0 sends as fast as the Link takes it"""
+        self.baudrate = baudrate
+        self.byte_time = (1 + bits + (parity is not None) + stop) / baudrate if baudrate else 0.0
+
+    def write(self, buf):
+        n = os.write(self.link.proxy_tx, buf)
+        if self.byte_time:
+            now = time.monotonic()
+            self.done_at = max(now, self.done_at) + n * self.byte_time
+            # Block while more than a TX buffer is still to go out
+            backlog = self.done_at - now - self.txbuf * self.byte_time
+            if backlog > 0:
+                time.sleep(backlog)
+        return n
+
+    def txdone(self):
+        return time.monotonic() >= self.done_at
+
+    def any(self):
+        return waiting(self.link.proxy_rx)
+
+    def read(self, nbytes=-1):
+        n = self.any()
+        if not n:
+            return None
+        return os.read(self.link.proxy_rx, n if nbytes < 0 else min(n, nbytes))
+
+    def readinto(self, buf, nbytes=None):
+        n = min(self.any(), len(buf) if nbytes is None else nbytes)
+        if not n:
+            return None
+        return os.readv(self.link.proxy_rx, [memoryview(buf)[:n]])
+
+    def deinit(self):
+        pass
+
+
+class Pin:
+    IN = gpio_bus.IN
+    OUT = gpio_bus.OUT
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        if mode != -1:
+            self.init(mode, pull)
+        if value is not None:
+            self.value(value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if mode != -1:
+            gpio_bus.bus.set_mode(self.id, mode)
+        if value is not None:
+            self.value(value)
+
+    def value(self, v=None):
+        if v is None:
+            return gpio_bus.bus.level(self.id)
+        gpio_bus.bus.drive(self.id, v)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def __repr__(self):
+        return f"Pin({self.id!r}, level={gpio_bus.bus.level(self.id)})"
+
+
+class _Memory:
+    """mem32, reads as 0. The GPIO transport only uses it on RP2 chips"""
+
+    def __getitem__(self, address):
+        return 0
+
+    def __setitem__(self, address, value):
+        pass
+
+
+mem32 = _Memory()
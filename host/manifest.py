@@ -0,0 +1,22 @@
+# ------------------------
+# Firmware Manifest
+# ------------------------
+#
+# Freezes the proxy into a MicroPython firmware image. Frozen modules run as
+# bytecode straight from flash, so they load faster than .mpy files and take
+# no heap to hold their code:
+#
+#   make -C ports/rp2 BOARD=RPI_PICO2_W FROZEN_MANIFEST=/path/to/SLAPI/host/manifest.py
+#
+# main.py and .env stay on the board's filesystem.
+
+# The board's own modules, networking and TLS among them
+include("$(BOARD_DIR)/manifest.py")
+
+for name in (
+    "body_pump", "config", "dns_cache", "env", "framing", "gpio_transport",
+    "http_body", "http_inflate", "http_pool", "jsonpath", "log", "lzss", "mux",
+    "paging", "pio_transport", "prefetch", "response_cache", "serial_transport",
+    "slapi", "stats", "transport", "wifi",
+):
+    module(name + ".py", base_path="../lib")
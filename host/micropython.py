@@ -0,0 +1,8 @@
+# ------------------------
+# micropython, for the Host Simulator
+# ------------------------
+
+
+def const(value):
+    """Folded in at compile time on MicroPython, a plain value here"""
+    return value
@@ -0,0 +1,50 @@
+# ------------------------
+# network, for the Host Simulator
+# ------------------------
+#
+# The host is already on the network. WLAN connects after ASSOCIATE_MS,
+# standing in for the time a board takes to join an access point.
+
+import time
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_GOT_IP = 3
+
+ASSOCIATE_MS = 0
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._active = False
+        self._status = STAT_IDLE
+        self._connect_at = None
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return self._active
+        self._active = bool(is_active)
+        if not self._active:
+            self._status = STAT_IDLE
+
+    def connect(self, ssid=None, key=None):
+        self._status = STAT_CONNECTING
+        self._connect_at = time.monotonic() + ASSOCIATE_MS / 1000
+
+    def disconnect(self):
+        self._status = STAT_IDLE
+
+    def status(self, param=None):
+        if self._status == STAT_CONNECTING and time.monotonic() >= self._connect_at:
+            self._status = STAT_GOT_IP
+        return self._status
+
+    def isconnected(self):
+        return self.status() == STAT_GOT_IP
+
+    def ifconfig(self):
+        return ("127.0.0.1", "255.0.0.0", "127.0.0.1", "127.0.0.1")
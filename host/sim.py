@@ -0,0 +1,97 @@
+# ------------------------
+# Host Simulator
+# ------------------------
+#
+# Runs the proxy in lib/ under CPython, unchanged from the device, with the
+# modules in this folder standing in for machine, network and deflate.
+#
+#   python host/sim.py [env file]
+#
+# The env file (default host/host.env) is read as lib/.env is on the device:
+#
+#   MODE=loopback       Serial transport on a pty or pipe Link, LINK=pty|pipe,
+#                       BAUD=0 for no limit
+#   MODE=gpio-8bit      GPIO transport on the simulated bus, with a Peer
+#   MODE=gpio-4bit      answering the handshake. LATENCY_US delays each of
+#                       the Peer's edges
+#   ASSOCIATE_MS=N      Wi-Fi takes N ms to connect, 0 by default
+#
+# With a pty the client opens the /dev/pts path printed at start up. With a
+# pipe, start() runs the proxy in a thread and returns the client's Link.
+
+import atexit
+import os
+import sys
+import tempfile
+import threading
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+LIB_DIR = os.path.join(os.path.dirname(HOST_DIR), "lib")
+DEFAULT_ENV = os.path.join(HOST_DIR, "host.env")
+READY = b"SLAPI/1.0 READY\r\n"
+
+
+def setup():
+    """Put host/ ahead of lib/ on the path and add the MicroPython functions"""
+    for path in (LIB_DIR, HOST_DIR):
+        if path in sys.path:
+            sys.path.remove(path)
+        sys.path.insert(0, path)
+    import compat
+    compat.install()
+
+
+def configure(env_file):
+    """
+    Read settings from env_file, starting the Peer for the GPIO modes.
+    Returns the Peer's client Link, or None when the transport has the Link.
+    """
+    import env
+    env.ENV_FILE = env_file
+    settings = env.read_env()
+    import network
+    network.ASSOCIATE_MS = int(settings.get("ASSOCIATE_MS", 0))
+    if settings.get("MODE") not in ("gpio-8bit", "gpio-4bit"):
+        return None
+
+    import gpio_bus
+    from link import Link
+    link = Link.pipe() if settings.get("LINK", "pty") == "pipe" else Link.pty()
+    if link.name:
+        print(f"GPIO peer on {link.name}", file=sys.stderr)
+    data_pins = [int(p.strip()) for p in settings.get("DATA_PINS", "").split(",")]
+    latency = int(settings.get("LATENCY_US", 0)) / 1000000
+    gpio_bus.Peer(
+        link, data_pins, int(settings.get("VALID_PIN", 0)), int(settings.get("ACK_PIN", 0)), latency
+    ).start()
+    return link
+
+
+def run_main():
+    import main  # Connects the (simulated) Wi-Fi and serves until the process ends
+
+
+def start(settings):
+    """
+    Start the proxy in a thread, settings being the lines of an env file.
+    Returns the client Link once the proxy is READY.
+    """
+    setup()
+    fd, env_file = tempfile.mkstemp(suffix=".env")
+    with os.fdopen(fd, "w") as f:
+        f.write("\n".join(settings) + "\n")
+    atexit.register(os.remove, env_file)
+    link = configure(env_file)
+
+    import slapi
+    if link is None:
+        link = slapi.transport.link
+    threading.Thread(target=run_main, daemon=True).start()
+    link.read_until(READY)
+    return link
+
+
+if __name__ == "__main__":
+    setup()
+    configure(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ENV)
+    run_main()
@@ -0,0 +1,137 @@
+# ------------------------
+# HTTP Stand-in Server
+# ------------------------
+#
+# A local server for the simulated proxy to call, with responses shaped by
+# the query string:
+#
+#   /json                    a small JSON document
+#   /data?size=N             a JSON document of about N bytes (default 4096)
+#     &gzip=1                gzip encoded, if the request accepts it
+#     &chunked=1             sent with Transfer-Encoding: chunked
+#     &delay=MS              the server thinks for MS milliseconds first
+#     &max_age=S             Cache-Control max-age, with an ETag
+#   /redirect?n=N&to=PATH    N 302 redirects, the last to PATH (default /json)
+#
+# /data answers Range requests. start() serves HTTPS when given a certificate.
+#
+#   python host/standin.py [port]
+
+import gzip
+import http.server
+import json
+import ssl
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+SMALL = {"status": "ok", "data": [{"id": 1, "name": "Alice"}, {"id": 2, "name": "Bob"}]}
+
+
+def document(size):
+    """A JSON document of about size bytes, the same for the same size"""
+    items = []
+    length = 12
+    i = 0
+    while length < size:
+        item = {"id": i, "name": f"item {i}", "value": (i * 7919) % 1000}
+        items.append(item)
+        length += len(json.dumps(item)) + 2
+        i += 1
+    return json.dumps({"items": items}).encode()
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.server.requests += 1
+        if "delay" in query:
+            time.sleep(int(query["delay"]) / 1000)
+        if url.path == "/json":
+            self.reply(200, json.dumps(SMALL).encode())
+        elif url.path == "/data":
+            self.data(query)
+        elif url.path == "/redirect":
+            self.redirect(query)
+        else:
+            self.reply(404, b'{"error": "not found"}')
+
+    def data(self, query):
+        body = document(int(query.get("size", 4096)))
+        headers = {}
+        if "max_age" in query:
+            headers["Cache-Control"] = f"max-age={query['max_age']}"
+            headers["ETag"] = f'"{len(body)}"'
+            if self.headers.get("If-None-Match") == headers["ETag"]:
+                self.reply(304, b"", headers)
+                return
+        span = self.headers.get("Range")
+        if span and span.startswith("bytes="):
+            first, last = span[6:].split("-")
+            first = int(first)
+            last = min(int(last) if last else len(body) - 1, len(body) - 1)
+            if first >= len(body):
+                headers["Content-Range"] = f"bytes */{len(body)}"
+                self.reply(416, b"", headers)
+                return
+            headers["Content-Range"] = f"bytes {first}-{last}/{len(body)}"
+            self.reply(206, body[first:last + 1], headers)
+            return
+        headers["Accept-Ranges"] = "bytes"
+        if query.get("gzip") and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        self.reply(200, body, headers, chunked=bool(query.get("chunked")))
+
+    def redirect(self, query):
+        n = int(query.get("n", 1))
+        to = query.get("to", "/json")
+        location = f"/redirect?n={n - 1}&to={to}" if n > 1 else to
+        self.reply(302, b"", {"Location": location})
+
+    def reply(self, status, body, headers=None, chunked=False):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if not chunked:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(0, len(body), 1000):
+            piece = body[i:i + 1000]
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start(port=0, certfile=None, keyfile=None):
+    """
+    Serve in a background thread, returns the server. server.server_port is
+    the port. With a certfile the server speaks HTTPS.
+    """
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    server.daemon_threads = True
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    server = start(int(sys.argv[1]) if len(sys.argv) > 1 else 8080)
+    print(f"Stand-in server on http://127.0.0.1:{server.server_port}")
+    threading.Event().wait()
@@ -0,0 +1,217 @@
+# ------------------------
+# Proxy Tests
+# ------------------------
+#
+# Requests through the simulated proxy to the stand-in server.
+#
+#   python -m pytest host
+#
+# The proxy only starts once per process, so the tests share it and put back
+# any setting they change.
+
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import sim
+import standin
+
+END = b"\r\n\r\n\x04"   # After the body, which may hold an EOT byte when binary
+
+
+class Client:
+    """Commands and requests over the client end of the proxy's Link"""
+
+    def __init__(self, link):
+        self.link = link
+
+    def command(self, line):
+        self.link.write(line.encode() + b"\r\n")
+        return self.link.read_until(b"\r\n")
+
+    def request(self, path, headers=b""):
+        """(status line, header lines, body) of a GET"""
+        self.link.write(f"GET {path} HTTP/1.1\r\n".encode() + headers + b"\r\n")
+        response = self.link.read_until(END)
+        head, body = response.split(b"\x01", 1)[1].split(b"\x02", 1)
+        status = response.split(b"\r\n", 1)[0]
+        return status, head.lower().split(b"\r\n"), body[:-len(END)]
+
+
+@pytest.fixture(scope="module")
+def server():
+    return standin.start()
+
+
+@pytest.fixture(scope="module")
+def client(server):
+    client = Client(sim.start(["MODE=loopback", "BAUD=0", "SSID=test", "PASSWORD=test", "LINK=pipe"]))
+    assert client.command(f"DOMAIN http://127.0.0.1:{server.server_port}") == b"OK\r\n"
+    return client
+
+
+def test_gzip_body_inflated(client):
+    status, headers, body = client.request("/data?size=500&gzip=1")
+    assert status == b"HTTP/1.1 200 OK"
+    assert b"content-encoding: gzip" not in headers
+    assert json.loads(body) == json.loads(standin.document(500))
+
+
+def test_client_accept_encoding_passed_through(client):
+    status, headers, body = client.request("/data?size=500&gzip=1", b"Accept-Encoding: gzip\r\n")
+    assert b"content-encoding: gzip" in headers
+    assert body.startswith(b"\x1f\x8b")
+
+
+def test_redirect_to_gzip_body_inflated(client):
+    # The proxy's own Accept-Encoding isn't taken for the client's on the next hop
+    status, headers, body = client.request("/redirect?to=/data?size=500%26gzip=1")
+    assert status == b"HTTP/1.1 200 OK"
+    assert b"content-encoding: gzip" not in headers
+    assert json.loads(body) == json.loads(standin.document(500))
+
+
+def body(response):
+    return response.split(b"\x02", 1)[1][:-len(END)]
+
+
+def frame(channel, data):
+    return bytes((channel, len(data) & 0xFF, len(data) >> 8)) + data
+
+
+def stuff(data):
+    """DLE, XON and XOFF escaped, as under FLOW X"""
+    out = bytearray()
+    for b in data:
+        out += bytes((0x10, b ^ 0x20)) if b in (0x10, 0x11, 0x13) else bytes((b,))
+    return bytes(out)
+
+
+def unstuff(data):
+    out = bytearray()
+    escape = False
+    for b in data:
+        if escape:
+            out.append(b ^ 0x20)
+            escape = False
+        elif b == 0x10:
+            escape = True
+        else:
+            out.append(b)
+    return bytes(out)
+
+
+def read_answers(link, channels, stuffed=False):
+    """Payloads per channel until each channel in channels has ended an answer"""
+    answers = {c: b"" for c in channels}
+    buf = b""
+    raw = b""
+    waiting = set(channels)
+    while waiting:
+        while len(buf) < 3 or len(buf) < 3 + (buf[1] | buf[2] << 8):
+            data = link.read(4096, 10)
+            if not data:
+                raise TimeoutError(f"No answer on channels {sorted(waiting)}")
+            if stuffed:
+                assert 0x11 not in data and 0x13 not in data
+                # Keep a DLE split from its byte for the next read
+                raw += data
+                cut = len(raw) - 1 if raw.endswith(b"\x10") else len(raw)
+                data, raw = unstuff(raw[:cut]), raw[cut:]
+            buf += data
+        channel, size = buf[0], buf[1] | buf[2] << 8
+        if size:
+            answers[channel] += buf[3:3 + size]
+        else:
+            waiting.discard(channel)
+        buf = buf[3 + size:]
+    return answers
+
+
+def test_mux_channels_keep_their_own_settings(client):
+    assert client.command("MUX ON") == b"OK\r\n"
+    link = client.link
+    try:
+        # Channel 1's response is still on its way when channel 0 sets a filter
+        link.write(frame(1, b"GET /data?size=300&delay=300 HTTP/1.1\r\n\r\n"))
+        link.write(frame(0, b"RESPONSE JSONPATH $.items[0].id\r\n"))
+        answers = read_answers(link, (0, 1))
+        assert answers[0] == b"OK\r\n"
+        assert json.loads(body(answers[1])) == json.loads(standin.document(300))
+
+        link.write(frame(0, b"GET /data?size=300 HTTP/1.1\r\n\r\n"))
+        link.write(frame(1, b"GET /data?size=300 HTTP/1.1\r\n\r\n"))
+        answers = read_answers(link, (0, 1))
+        assert body(answers[0]) == b"0"
+        assert json.loads(body(answers[1])) == json.loads(standin.document(300))
+    finally:
+        link.write(frame(0, b"MUX OFF\r\n"))
+        read_answers(link, (0,))
+    # Back on the line protocol the link's own settings are as they were
+    status, headers, plain = client.request("/data?size=300")
+    assert json.loads(plain) == json.loads(standin.document(300))
+
+
+def test_serial_command_updates_flow_timing(client):
+    transport = sys.modules["slapi"].transport
+    try:
+        assert client.command("SERIAL 115200,8,N,1") == b"OK\r\n"
+        assert (transport.baudrate, transport.chunk_us) == (115200, 16 * 10 * 1000000 // 115200)
+        assert client.command("SERIAL 9600,7,E,2") == b"OK\r\n"
+        assert transport.frame_us == (1 + 7 + 1 + 2) * 1000000
+    finally:
+        client.command("SERIAL 0,8,N,1")
+    assert transport.chunk_us == 0
+
+
+def test_mux_frames_stuffed_under_flow_x(client):
+    assert client.command("FLOW X") == b"OK\r\n"
+    assert client.command("MUX ON") == b"OK\r\n"
+    link = client.link
+    try:
+        # Lengths of 17 and 19 are XON and XOFF, in both directions
+        command = b"HEADERS X-AB 12\r\n"
+        assert len(command) == 0x11
+        link.write(stuff(frame(0, command)))
+        assert read_answers(link, (0,), stuffed=True)[0] == b"OK\r\n"
+        link.write(stuff(frame(0, b"HEADERS CLEAR\r\n")))
+        link.write(stuff(frame(0, b"HEADERS X-abcd 123456789\r\n")))
+        assert read_answers(link, (0,), stuffed=True)[0] == b"OK\r\n"
+        assert read_answers(link, (0,), stuffed=True)[0] == b"OK\r\n"
+        link.write(stuff(frame(0, b"HEADERS\r\n")))
+        answer = read_answers(link, (0,), stuffed=True)[0]
+        assert answer == b"x-abcd: 123456789\r\n" and len(answer) == 0x13
+        link.write(stuff(frame(0, b"FLOW OFF\r\n")))
+        assert read_answers(link, (0,), stuffed=True)[0].startswith(b"SLAPI/1.0 400")
+    finally:
+        link.write(stuff(frame(0, b"MUX OFF\r\n")))
+        read_answers(link, (0,), stuffed=True)
+        client.command("FLOW OFF")
+
+
+def test_prefetch_keeps_registered_settings(client):
+    state = sys.modules["slapi"].state
+    prefetch = sys.modules["prefetch"]
+    try:
+        assert client.command("CACHE ON") == b"OK\r\n"
+        assert client.command("HEADERS X-Key abc") == b"OK\r\n"
+        assert client.command("PREFETCH 5 /data?size=100&max_age=60") == b"OK\r\n"
+        time.sleep(0.5)
+        # The stand-in only speaks HTTP, so the refresh fails if it follows these
+        assert client.command("HTTPS") == b"OK\r\n"
+        assert client.command("HEADERS CLEAR") == b"OK\r\n"
+        job = prefetch.jobs[0]
+        assert job.headers == {"x-key": "abc"}
+        job.next_run = time.ticks_ms()
+        time.sleep(0.5)
+        line = client.command("PREFETCH")
+        assert b"refreshes=2 failures=0" in line
+    finally:
+        client.command("PREFETCH CLEAR")
+        client.command("CACHE OFF")
+        state["use_ssl"] = None
@@ -0,0 +1,95 @@
+# MicroPython imports
+import asyncio
+
+import stats
+
+# ------------------------
+# Overlapped Body Transfer
+# ------------------------
+#
+# A reader task takes the response body from the socket into a ring buffer
+# while the caller feeds it through the body pipeline and writes the link, so
+# the download continues while the slow link drains. When the ring is full
+# the reader waits, the TCP window closes and the server is held back.
+
+PIPE_SIZE = 4096    # Body bytes buffered ahead of the link
+FEED_SIZE = 256     # Bytes fed to the pipeline between writes to the link
+
+
+class Pump:
+    """Bounded buffer between an upstream socket and the body pipeline"""
+
+    def __init__(self, size=PIPE_SIZE):
+        self.size = size
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.readable = asyncio.Event()
+        self.writable = asyncio.Event()
+        self.head = 0       # Next byte to feed
+        self.count = 0      # Bytes buffered
+        self.eof = False
+        self.error = None
+
+    async def _reader(self, stream):
+        try:
+            while True:
+                while self.count == self.size:
+                    self.writable.clear()
+                    await self.writable.wait()
+                # Fill the free space up to the end of the ring, or up to head
+                start = (self.head + self.count) % self.size
+                end = min(self.size, start + self.size - self.count)
+                n = await stream.readinto(self.view[start:end])
+                if n is None:
+                    continue  # Woken without data, e.g. part of a TLS record
+                if not n:
+                    break
+                self.count += n
+                self.readable.set()
+        except OSError as e:
+            self.error = e
+        self.eof = True
+        self.readable.set()
+
+    async def run(self, sock, data, decoder, consumer, flush):
+        """
+        Feed a response body through its framing decoder, as read_body does.
+        flush() is awaited after each piece to write the link. Reading stops
+        early once consumer.done is set. Returns True if the whole body was read.
+        """
+        if data:
+            decoder.feed(data)
+            await flush()
+        if decoder.done:
+            return True
+
+        self.head = self.count = 0
+        self.eof = False
+        self.error = None
+        self.readable.clear()
+        self.writable.clear()
+        sock.setblocking(False)
+        task = asyncio.create_task(self._reader(asyncio.StreamReader(sock)))
+        try:
+            while not decoder.done:
+                if consumer is not None and consumer.done:
+                    return False
+                if not self.count:
+                    if self.eof:
+                        if self.error is not None:
+                            raise self.error
+                        return decoder.eof()
+                    self.readable.clear()
+                    await self.readable.wait()
+                    continue
+                n = min(self.count, self.size - self.head, FEED_SIZE)
+                stats.count("upstream_in", n)   # Here, in the request's task
+                decoder.feed(self.view[self.head:self.head + n])
+                self.head = (self.head + n) % self.size
+                self.count -= n
+                self.writable.set()
+                await flush()
+            return True
+        finally:
+            task.cancel()
+            sock.setblocking(True)
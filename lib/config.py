@@ -1,8 +1,6 @@
 import sys
 
 from transport import Transport
-from gpio_transport import GPIO4Bit, GPIO8Bit
-from serial_transport import Serial
 from env import read_env
 
 
@@ -11,10 +9,12 @@ def load_config() -> Transport:
     # Load configuration from env.txt
     env = read_env()
 
-    # Determine interface type from env
+    # Determine interface type from env. Each mode imports only its own
+    # transport, so the others are never loaded
     mode = env.get('MODE', 'uart')
 
     if mode == 'uart':
+        from serial_transport import Serial
         port = int(env.get('PORT', 0))
         baud = int(env.get('BAUD', 9600))
         bits = int(env.get('BITS', 8))
@@ -51,6 +51,7 @@ def load_config() -> Transport:
         return serial
         
     elif mode == 'gpio-8bit':
+        from gpio_transport import GPIO8Bit
         data_pins = [int(p.strip()) for p in env.get('DATA_PINS', '').split(',')]
         valid_pin = int(env.get('VALID_PIN', 0))
         ack_pin = int(env.get('ACK_PIN', 0))
@@ -66,6 +67,7 @@ def load_config() -> Transport:
         return gpio
         
     elif mode == 'gpio-4bit':
+        from gpio_transport import GPIO4Bit
         data_pins = [int(p.strip()) for p in env.get('DATA_PINS', '').split(',')]
         valid_pin = int(env.get('VALID_PIN', 0))
         ack_pin = int(env.get('ACK_PIN', 0))
@@ -79,6 +81,36 @@ def load_config() -> Transport:
         gpio = GPIO4Bit(data_pins, valid_pin, ack_pin, timeout_ms, min_hold_time_ms)
         return gpio
     
+    elif mode in ('pio-8bit', 'pio-4bit'):
+        # Only the RP2 ports have PIO, so import it here
+        from pio_transport import PIO4Bit, PIO8Bit
+        width = 8 if mode == 'pio-8bit' else 4
+        data_pins = [int(p.strip()) for p in env.get('DATA_PINS', '').split(',')]
+        valid_pin = int(env.get('VALID_PIN', 0))
+        ack_pin = int(env.get('ACK_PIN', 0))
+        timeout_ms = int(env.get('TIMEOUT_MS', 0))
+        min_hold_time_ms = int(env.get('MIN_HOLD_TIME_MS', 10)) # Default to 10ms if not specified
+        if len(data_pins) != width:
+            print(f"Error: {mode} mode requires {width} DATA_PINS", file=sys.stderr)
+            sys.exit(1)
+
+        print(f"Using {width}-bit PIO: data={data_pins}, valid={valid_pin}, ack={ack_pin}", file=sys.stderr)
+        pio_class = PIO8Bit if width == 8 else PIO4Bit
+        try:
+            pio = pio_class(data_pins, valid_pin, ack_pin, timeout_ms, min_hold_time_ms)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return pio
+
+    elif mode == 'loopback':
+        # Only the host simulator has a loopback link, see host/sim.py
+        from loopback_transport import LoopbackTransport
+        link = env.get('LINK', 'pty')
+        baud = int(env.get('BAUD', 0))
+        print(f"Using loopback: link={link}, baud={baud}", file=sys.stderr)
+        return LoopbackTransport(link, baudrate=baud)
+
     else:
         print(f"Error: Unknown MODE '{mode}' in env.txt", file=sys.stderr)
         sys.exit(1)
@@ -0,0 +1,69 @@
+# MicroPython imports
+import socket
+import time
+
+# ------------------------
+# DNS Resolution Cache
+# ------------------------
+
+MAX_ENTRIES = 8
+TTL_MS = 300000          # getaddrinfo does not report record TTLs, so use a fixed one
+NEGATIVE_TTL_MS = 10000  # Failed lookups are remembered briefly so retries don't stall the link
+
+# (host, port) -> [addr or None, error or None, expires_ms, last_used_ms]
+_entries = {}
+hits = 0
+misses = 0
+
+
+def _store(key, addr, err, ttl_ms, now):
+    if key not in _entries and len(_entries) >= MAX_ENTRIES:
+        # Evict the least recently used entry
+        lru = None
+        for k, entry in _entries.items():
+            if lru is None or time.ticks_diff(_entries[lru][3], entry[3]) > 0:
+                lru = k
+        del _entries[lru]
+    _entries[key] = [addr, err, time.ticks_add(now, ttl_ms), now]
+
+
+def resolve(host, port):
+    """Resolve host to a socket address, raising OSError on failure"""
+    global hits, misses
+    now = time.ticks_ms()
+    key = (host, port)
+    entry = _entries.get(key)
+    if entry and time.ticks_diff(entry[2], now) > 0:
+        hits += 1
+        entry[3] = now
+        if entry[0] is None:
+            raise entry[1]
+        return entry[0]
+
+    misses += 1
+    try:
+        addr = socket.getaddrinfo(host, port)[0][-1]
+    except OSError as e:
+        _store(key, None, e, NEGATIVE_TTL_MS, now)
+        raise
+    _store(key, addr, None, TTL_MS, now)
+    return addr
+
+
+def flush():
+    """Forget every cached lookup and reset the counters"""
+    global hits, misses
+    _entries.clear()
+    hits = 0
+    misses = 0
+
+
+def entries():
+    """List of (host, port, addr or None, seconds left) for live entries"""
+    now = time.ticks_ms()
+    result = []
+    for (host, port), entry in _entries.items():
+        left = time.ticks_diff(entry[2], now)
+        if left > 0:
+            result.append((host, port, entry[0], left // 1000))
+    return result
@@ -0,0 +1,93 @@
+# ------------------------
+# Length Framed Bodies
+# ------------------------
+#
+# With RESPONSE FRAMING LENGTH the body is sent as frames, each a 16-bit
+# little endian length followed by that many bytes, and ends with a zero
+# length frame. This is the frame layout of COMPRESS LZSS without the
+# compression, so a client can copy each frame whole and binary bodies pass
+# intact. Small writes, such as the pieces of a JSONPath result, are gathered
+# into one frame until flush().
+#
+# With FLOW X the framed part of a response is byte stuffed, so XON and XOFF
+# never appear in it: DLE, XON and XOFF are each sent as DLE followed by the
+# byte XOR 0x20. Lengths count the bytes before stuffing. With MUX on, every
+# frame is stuffed in both directions, this way.
+
+FRAME_SIZE = 1024
+DLE = 0x10
+XON = 0x11
+XOFF = 0x13
+
+
+def stuff(data):
+    """Escape DLE, XON and XOFF in data"""
+    data = bytes(data)
+    if DLE not in data and XON not in data and XOFF not in data:
+        return data
+    out = bytearray()
+    for b in data:
+        if b == DLE or b == XON or b == XOFF:
+            out.append(DLE)
+            out.append(b ^ 0x20)
+        else:
+            out.append(b)
+    return out
+
+
+class Unstuffer:
+    """Removes the stuffing from what the client sends, an escape may span reads"""
+
+    def __init__(self):
+        self.escape = False
+
+    def feed(self, data):
+        if not self.escape and DLE not in data:
+            return data
+        out = bytearray()
+        for b in data:
+            if self.escape:
+                out.append(b ^ 0x20)
+                self.escape = False
+            elif b == DLE:
+                self.escape = True
+            else:
+                out.append(b)
+        return bytes(out)
+
+
+def header(size):
+    return bytes((size & 0xFF, size >> 8))
+
+
+class Framer:
+    """Cuts a body into frames, passing each whole frame on to sink()"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.buf = bytearray(2 + FRAME_SIZE)
+        self.fill = 0
+
+    def feed(self, data):
+        view = memoryview(data)
+        pos = 0
+        while pos < len(view):
+            n = min(len(view) - pos, FRAME_SIZE - self.fill)
+            self.buf[2 + self.fill:2 + self.fill + n] = view[pos:pos + n]
+            self.fill += n
+            pos += n
+            if self.fill == FRAME_SIZE:
+                self.flush()
+
+    def flush(self):
+        """Send what has been gathered as a frame"""
+        if self.fill:
+            self.buf[0] = self.fill & 0xFF
+            self.buf[1] = self.fill >> 8
+            self.sink(memoryview(self.buf)[:2 + self.fill])
+            self.fill = 0
+
+    def finish(self):
+        """Send the last frame and the end of body frame"""
+        self.flush()
+        self.sink(b"\x00\x00")
@@ -1,6 +1,7 @@
 # MicroPython imports
 import sys
-from machine import Pin
+from machine import Pin, mem32
+from micropython import const
 import utime as time
 
 from transport import Transport
@@ -9,7 +10,21 @@ from transport import Transport
 # GPIO Parallel Interface
 # ------------------------
 
-DEBUG = False  # Set to True to enable debug logging of pin states and timing
+DEBUG = const(0)  # 1 logs pin states and timing, 0 compiles the logging out
+
+# RP2 single-cycle IO registers, used to drive or sample all data pins at once
+SIO_BASE = 0xD0000000
+SIO_GPIO_IN = SIO_BASE + 0x004
+_machine = getattr(sys.implementation, "_machine", "")
+if "RP2350" in _machine:
+    SIO_GPIO_OUT_SET = SIO_BASE + 0x018
+    SIO_GPIO_OUT_CLR = SIO_BASE + 0x020
+elif "RP2040" in _machine:
+    SIO_GPIO_OUT_SET = SIO_BASE + 0x014
+    SIO_GPIO_OUT_CLR = SIO_BASE + 0x018
+else:
+    SIO_GPIO_OUT_SET = None  # Other chips use per-pin access
+    SIO_GPIO_OUT_CLR = None
 
 class GPIO(Transport):
     """
@@ -36,7 +51,12 @@ class GPIO(Transport):
         self.TIMEOUT_MS = timeout_ms  # Default timeout in milliseconds
         self.MIN_HOLD_TIME_MS = min_hold_time_ms
 
-        # MicroPython Pin setup
+        # Pins are created once, only their direction changes
+        self.data = [Pin(p) for p in data_pins]
+        self.valid = Pin(valid_pin)
+        self.ack = Pin(ack_pin)
+        self.direction = None
+        self._init_port()
         self._set_data_pins_input()
 
         self.read_buffer = bytearray()
@@ -70,18 +90,74 @@ class GPIO(Transport):
                 raise RuntimeError("Timeout waiting for ACK signal to be {}".format(v))
         return True
 
+    def _init_port(self):
+        """Precompute SIO register masks for the data pins, if the chip has them"""
+        self.port = SIO_GPIO_OUT_SET is not None and max(self.data_pins) < 32
+        if not self.port:
+            return
+        self.data_mask = 0
+        for p in self.data_pins:
+            self.data_mask |= 1 << p
+        # Bits to set and to clear for every possible value
+        self.set_masks = []
+        self.clr_masks = []
+        for value in range(1 << self.DATA_WIDTH):
+            mask = 0
+            for i, p in enumerate(self.data_pins):
+                if (value >> i) & 1:
+                    mask |= 1 << p
+            self.set_masks.append(mask)
+            self.clr_masks.append(self.data_mask ^ mask)
+        # Consecutive pins are read with a single shift
+        first = self.data_pins[0]
+        consecutive = list(self.data_pins) == list(range(first, first + self.DATA_WIDTH))
+        self.in_shift = first if consecutive else None
+        self.in_mask = (1 << self.DATA_WIDTH) - 1
+
+    def _write_data(self, value):
+        """Drive value onto the data pins"""
+        if self.port:
+            mem32[SIO_GPIO_OUT_CLR] = self.clr_masks[value]
+            mem32[SIO_GPIO_OUT_SET] = self.set_masks[value]
+            return
+        for i, pin in enumerate(self.data):
+            pin.value((value >> i) & 1)
+
+    def _read_data(self):
+        """Sample the data pins"""
+        if self.port:
+            levels = mem32[SIO_GPIO_IN]
+            if self.in_shift is not None:
+                return (levels >> self.in_shift) & self.in_mask
+            value = 0
+            for i, p in enumerate(self.data_pins):
+                if levels & (1 << p):
+                    value |= 1 << i
+            return value
+        value = 0
+        for i, pin in enumerate(self.data):
+            if pin.value():
+                value |= 1 << i
+        return value
+
     def _set_data_pins_output(self):
         """Set data pins as outputs (for writing)"""
-        self.data = [Pin(p, Pin.OUT) for p in self.data_pins]
-        self.ack = Pin(self.ack_pin, Pin.IN, Pin.PULL_UP)
-        self.valid = Pin(self.valid_pin, Pin.OUT)
+        if self.direction != "out":
+            for pin in self.data:
+                pin.init(Pin.OUT)
+            self.ack.init(Pin.IN, Pin.PULL_UP)
+            self.valid.init(Pin.OUT)
+            self.direction = "out"
         self.valid.value(0)
 
     def _set_data_pins_input(self):
         """Set data pins as inputs (for reading)"""
-        self.data = [Pin(p, Pin.IN, Pin.PULL_UP) for p in self.data_pins]
-        self.valid = Pin(self.valid_pin, Pin.IN, Pin.PULL_UP)
-        self.ack = Pin(self.ack_pin, Pin.OUT)
+        if self.direction != "in":
+            for pin in self.data:
+                pin.init(Pin.IN, Pin.PULL_UP)
+            self.valid.init(Pin.IN, Pin.PULL_UP)
+            self.ack.init(Pin.OUT)
+            self.direction = "in"
         self.ack.value(0)
 
     def _write_byte(self, byte):
@@ -90,7 +166,7 @@ class GPIO(Transport):
 
     def _write_nibble(self, nibble):
         """Write a 4-bit nibble"""
-        self._set_data_pins_output()
+        self.valid.value(0)  # The receiver waits for VALID low between nibbles
         if DEBUG:
             print("Waiting for ACK low")
         self._wait_until_ack_is(0)
@@ -98,8 +174,7 @@ class GPIO(Transport):
         if DEBUG:
             print("Writing nibble: ", nibble)
 
-        for i, pin in enumerate(self.data):
-            pin.value((nibble >> i) & 1)
+        self._write_data(nibble)
 
         if DEBUG:
             print("setting VALID high")
@@ -119,7 +194,7 @@ class GPIO(Transport):
 
     def _read_nibble(self):
         """Read a 4-bit nibble"""
-        self._set_data_pins_input()
+        self.ack.value(0)
 
         # Resync: ensure we start only after VALID is low
         # if not self._wait_until_valid_is(0):
@@ -136,10 +211,7 @@ class GPIO(Transport):
         # Small settle time for data lines
         # time.sleep_us(5)
 
-        nibble = 0
-        for i, pin in enumerate(self.data):
-            if pin.value():
-                nibble |= 1 << i
+        nibble = self._read_data()
 
         if DEBUG:
             print("Read nibble:", nibble)
@@ -165,11 +237,16 @@ class GPIO(Transport):
         self._wait_until_valid_is(0)  # Ensure VALID is low before reading
         return
 
+    def any(self):
+        """In read mode VALID rises when the client starts sending"""
+        return self.direction == "in" and self.valid.value() == 1
+
     def write(self, data):
         """Write data (compatible with UART interface)"""
         if isinstance(data, str):
             data = data.encode()
 
+        self._set_data_pins_output()
         for byte in data:
             self._write_byte(byte)
 
@@ -179,6 +256,7 @@ class GPIO(Transport):
         """Read data (compatible with UART interface)"""
         result = bytearray()
 
+        self._set_data_pins_input()
         for _ in range(size):
             byte = self._read_byte()
             if byte is None:
@@ -187,6 +265,27 @@ class GPIO(Transport):
 
         return bytes(result)
 
+    def write_from(self, buf):
+        """Write data straight from a buffer"""
+        self._set_data_pins_output()
+        for byte in memoryview(buf):
+            self._write_byte(byte)
+        return len(buf)
+
+    def readinto(self, buf):
+        """
+        Read a single byte into buf. In 4-bit mode VALID stays high after the
+        last nibble, so there is no telling whether another byte follows.
+        """
+        if not len(buf):
+            return 0
+        self._set_data_pins_input()
+        byte = self._read_byte()
+        if byte is None:
+            return 0
+        buf[0] = byte
+        return self._filter_flow(buf, 1)
+
     def init(self, **kwargs):
         """Reconfigure interface (for compatibility with UART)"""
         # GPIO mode doesn't support reconfiguration like UART
@@ -204,11 +303,7 @@ class GPIO8Bit(GPIO):
 
     def _write_byte(self, byte):
         """Write byte in 8-bit parallel mode"""
-        self._set_data_pins_output()
-
-        # Set data pins
-        for i, pin in enumerate(self.data):
-            pin.value((byte >> i) & 1)
+        self._write_data(byte)
 
         self.valid.value(1)
         self._wait_until_ack_is(1)
@@ -217,14 +312,8 @@ class GPIO8Bit(GPIO):
 
     def _read_byte(self):
         """Read byte in 8-bit parallel mode"""
-        self._set_data_pins_input()
-
         self._wait_until_valid_is(1)
-        # Read data pins
-        byte = 0
-        for i, pin in enumerate(self.data):
-            if pin.value():
-                byte |= 1 << i
+        byte = self._read_data()
         self.ack.value(1)
         self._wait_until_valid_is(0)
         self.ack.value(0)
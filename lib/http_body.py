@@ -0,0 +1,114 @@
+# ------------------------
+# HTTP Response Body Framing
+# ------------------------
+#
+# Each decoder takes raw bytes from the socket through feed() and passes the
+# decoded body on to sink() piece by piece, so nothing is buffered beyond the
+# bytes of the current read. `done` goes True once the end of the body has
+# been seen; eof() is called if the server closes first and says whether the
+# body was complete anyway.
+
+MAX_LINE = 256  # Longest chunk-size or trailer line accepted
+
+_SIZE = 0
+_DATA = 1
+_DATA_END = 2
+_TRAILER = 3
+
+
+class LengthBody:
+    """Body delimited by Content-Length"""
+
+    def __init__(self, length, sink):
+        self.sink = sink
+        self.remaining = length
+        self.done = length == 0
+
+    def feed(self, data):
+        if self.done:
+            return
+        if len(data) > self.remaining:
+            data = data[:self.remaining]
+        self.remaining -= len(data)
+        self.sink(data)
+        self.done = self.remaining == 0
+
+    def eof(self):
+        return self.done
+
+
+class CloseBody:
+    """Body delimited by the server closing the connection"""
+
+    done = False
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def feed(self, data):
+        self.sink(data)
+
+    def eof(self):
+        return True
+
+
+class ChunkedBody:
+    """Incremental decoder for Transfer-Encoding: chunked"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.state = _SIZE
+        self.remaining = 0
+        self.line = bytearray()
+        self.trailers = []
+        self.done = False
+
+    def feed(self, data):
+        view = memoryview(data)
+        i = 0
+        n = len(view)
+        while i < n and not self.done:
+            if self.state == _DATA:
+                # Hand chunk data straight through without copying
+                k = min(self.remaining, n - i)
+                self.sink(view[i:i + k])
+                i += k
+                self.remaining -= k
+                if self.remaining == 0:
+                    self.state = _DATA_END
+                continue
+
+            b = view[i]
+            i += 1
+            if b != 0x0A:
+                if len(self.line) >= MAX_LINE:
+                    raise ValueError("Chunked encoding line too long")
+                self.line.append(b)
+                continue
+            line = bytes(self.line).rstrip(b"\r")
+            self.line = bytearray()
+            self._line(line)
+
+    def _line(self, line):
+        if self.state == _SIZE:
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise ValueError("Invalid chunk size")
+            if size == 0:
+                self.state = _TRAILER
+            else:
+                self.remaining = size
+                self.state = _DATA
+        elif self.state == _DATA_END:
+            if line:
+                raise ValueError("Missing CRLF after chunk data")
+            self.state = _SIZE
+        elif self.state == _TRAILER:
+            if line:
+                self.trailers.append(line)
+            else:
+                self.done = True
+
+    def eof(self):
+        return self.done
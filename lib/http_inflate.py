@@ -0,0 +1,96 @@
+# MicroPython imports
+import io
+
+try:
+    import deflate
+except ImportError:
+    deflate = None  # Firmware before 1.21, responses are requested uncompressed
+
+# ------------------------
+# Content-Encoding Decoder
+# ------------------------
+#
+# deflate.DeflateIO pulls its input from a stream, while response bodies are
+# pushed to us a socket read at a time. Compressed bytes are queued in a
+# _FeedStream and output is only pulled while at least MARGIN bytes are
+# queued, so the decompressor never runs dry in the middle of a block. The
+# remainder is drained by finish() once the whole body has arrived.
+
+ENCODINGS = ("gzip", "x-gzip", "deflate")
+ACCEPT_ENCODING = "gzip, deflate"
+
+MARGIN = 2048      # Compressed bytes kept queued while decompressing
+OUT_SIZE = 256     # Decompressed bytes produced per pull
+
+
+def available():
+    return deflate is not None
+
+
+class _FeedStream(io.IOBase):
+    """Byte queue that DeflateIO reads the compressed body from"""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.pos = 0
+
+    def queued(self):
+        return len(self.buf) - self.pos
+
+    def append(self, data):
+        if self.pos:
+            # Drop what has been consumed before growing the queue
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf.extend(data)
+
+    def readinto(self, buf):
+        n = min(len(buf), len(self.buf) - self.pos)
+        buf[:n] = self.buf[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+
+class Inflater:
+    """Decompresses a gzip or deflate body, passing the result on to sink()"""
+
+    def __init__(self, encoding, sink):
+        self.encoding = encoding
+        self.sink = sink
+        self.stream = _FeedStream()
+        self.io = None
+        self.out = bytearray(OUT_SIZE)
+        self.out_view = memoryview(self.out)
+
+    def _open(self):
+        if self.encoding == "deflate":
+            # Meant to be zlib wrapped, but some servers send raw deflate
+            head = self.stream.buf[self.stream.pos:self.stream.pos + 2]
+            zlib = len(head) == 2 and head[0] & 0x0F == 8 and (head[0] * 256 + head[1]) % 31 == 0
+            fmt = deflate.ZLIB if zlib else deflate.RAW
+        else:
+            fmt = deflate.GZIP
+        self.io = deflate.DeflateIO(self.stream, fmt)
+
+    def _pull(self, margin):
+        if self.io is None:
+            self._open()
+        while self.stream.queued() > margin:
+            try:
+                n = self.io.readinto(self.out)
+            except OSError:
+                raise ValueError("Invalid compressed body")
+            if not n:
+                return
+            self.sink(self.out_view[:n])
+
+    def feed(self, data):
+        self.stream.append(data)
+        if self.stream.queued() > MARGIN:
+            self._pull(MARGIN)
+
+    def finish(self):
+        """Decompress whatever is still queued, once the body is complete"""
+        if self.io is None and not self.stream.queued():
+            return
+        self._pull(-1)
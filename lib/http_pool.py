@@ -0,0 +1,65 @@
+# MicroPython imports
+import time
+
+# ------------------------
+# Upstream Connection Pool
+# ------------------------
+
+IDLE_TIMEOUT_MS = 15000  # Idle connections older than this are closed, servers drop them anyway
+MAX_PER_HOST = 2         # Idle connections kept per (host, port, tls) key
+MAX_TOTAL = 4            # Idle connections kept across all keys (each TLS session costs RAM)
+
+# (host, port, use_ssl) -> list of (sock, last_used_ms), oldest first
+_idle = {}
+
+
+def _close(sock):
+    try:
+        sock.close()
+    except OSError:
+        pass
+
+
+def _count():
+    return sum(len(conns) for conns in _idle.values())
+
+
+def expire():
+    """Close idle connections that have passed IDLE_TIMEOUT_MS"""
+    now = time.ticks_ms()
+    for key in list(_idle):
+        conns = _idle[key]
+        while conns and time.ticks_diff(now, conns[0][1]) > IDLE_TIMEOUT_MS:
+            _close(conns.pop(0)[0])
+        if not conns:
+            del _idle[key]
+
+
+def get(key):
+    """Take a kept-alive connection for key, or None if there is none"""
+    expire()
+    conns = _idle.get(key)
+    if not conns:
+        return None
+    sock = conns.pop()[0]  # Most recently used is the least likely to be stale
+    if not conns:
+        del _idle[key]
+    return sock
+
+
+def put(key, sock):
+    """Return a connection whose response has been fully read to the pool"""
+    expire()
+    conns = _idle.setdefault(key, [])
+    if len(conns) >= MAX_PER_HOST:
+        _close(conns.pop(0)[0])
+    if _count() >= MAX_TOTAL:
+        # Evict the oldest idle connection of any key
+        oldest = None
+        for k, c in _idle.items():
+            if c and (oldest is None or time.ticks_diff(oldest[1], c[0][1]) > 0):
+                oldest = (k, c[0][1])
+        if oldest:
+            _close(_idle[oldest[0]].pop(0)[0])
+    conns.append((sock, time.ticks_ms()))
+
@@ -0,0 +1,545 @@
+# MicroPython imports
+import json
+
+# ------------------------
+# JSONPath
+# ------------------------
+#
+# Expressions are compiled once into a list of (kind, arg) steps when
+# RESPONSE JSONPATH is issued. Both evaluators below run the compiled steps.
+
+KEY = 0      # .key or ['key']      arg: key
+INDEX = 1    # [n]                  arg: n, may be negative
+WILD = 2     # [*]                  arg: None
+SLICE = 3    # [a:b]                arg: (a, b), either may be None
+FILTER = 4   # [?(@.k==v)]          arg: (keys, op, value), op None tests existence
+
+_FILTER_OPS = ("==", "!=", "<=", ">=", "<", ">")
+
+
+def _literal(text):
+    """Value on the right of a filter comparison"""
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        return text[1:-1]
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text  # Bare word, treat as a string
+
+
+def _compile_filter(expr):
+    if not expr.startswith("?(") or not expr.endswith(")"):
+        raise ValueError(f"Invalid JSONPath filter: [{expr}]")
+    expr = expr[2:-1].strip()
+    op = None
+    for candidate in _FILTER_OPS:
+        at = expr.find(candidate)
+        if at > 0:
+            op = candidate
+            left = expr[:at].strip()
+            value = _literal(expr[at + len(candidate):])
+            break
+    else:
+        left = expr
+        value = None
+    if not left.startswith("@.") or len(left) < 3:
+        raise ValueError(f"JSONPath filter must test @.key: [?({expr})]")
+    return (FILTER, (tuple(left[2:].split(".")), op, value))
+
+
+def _compile_bracket(content):
+    content = content.strip()
+    if content == "*":
+        return (WILD, None)
+    if content.startswith("?"):
+        return _compile_filter(content)
+    if len(content) >= 2 and content[0] == content[-1] and content[0] in "'\"":
+        return (KEY, content[1:-1])
+    try:
+        if ":" in content:
+            start, stop = content.split(":", 1)
+            start = int(start) if start.strip() else None
+            stop = int(stop) if stop.strip() else None
+            return (SLICE, (start, stop))
+        return (INDEX, int(content))
+    except ValueError:
+        raise ValueError(f"Invalid JSONPath index: [{content}]")
+
+
+def _filter_end(path, i):
+    """Index of the ] closing the filter at path[i], skipping quoted values"""
+    quote = None
+    for j in range(i + 2, len(path)):
+        ch = path[j]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == ")" and path.startswith(")]", j):
+            return j + 1
+    return -1
+
+
+def compile(path):
+    """Compile a JSONPath-like expression into steps, raising ValueError on bad syntax"""
+    path = path.strip()
+    if not path.startswith("$"):
+        raise ValueError("JSONPath must start with $")
+    steps = []
+    i = 1  # Skip the leading $
+    n = len(path)
+    while i < n:
+        ch = path[i]
+        if ch == ".":
+            i += 1
+        elif ch == "[":
+            end = _filter_end(path, i) if path.startswith("[?", i) else path.find("]", i)
+            if end < 0:
+                raise ValueError("Unclosed [ in JSONPath")
+            steps.append(_compile_bracket(path[i + 1:end]))
+            i = end + 1
+        else:
+            j = i
+            while j < n and path[j] not in ".[":
+                j += 1
+            steps.append((KEY, path[i:j]))
+            i = j
+    return steps
+
+
+def filter_match(item, arg):
+    """Test one element against a compiled filter"""
+    keys, op, value = arg
+    for key in keys:
+        if not isinstance(item, dict) or key not in item:
+            return False
+        item = item[key]
+    if op is None:
+        return True
+    try:
+        if op == "==":
+            return item == value
+        if op == "!=":
+            return item != value
+        if op == "<":
+            return item < value
+        if op == "<=":
+            return item <= value
+        if op == ">":
+            return item > value
+        return item >= value
+    except TypeError:
+        return False
+
+
+def apply_steps(data, steps):
+    """Apply compiled steps to decoded JSON data"""
+    result = data
+    for kind, arg in steps:
+        if kind == KEY:
+            if isinstance(result, list):
+                # Apply to each element in list
+                new_result = []
+                for item in result:
+                    if isinstance(item, dict) and arg in item:
+                        new_result.append(item[arg])
+                result = new_result if new_result else None
+            elif isinstance(result, dict):
+                result = result.get(arg)
+            else:
+                return None
+        elif kind == WILD:
+            # Wildcard - keep as list for further processing
+            if isinstance(result, dict):
+                result = list(result.values())
+            elif not isinstance(result, list):
+                return None
+        elif kind == INDEX:
+            if not isinstance(result, list) or not -len(result) <= arg < len(result):
+                return None
+            result = result[arg]
+        elif kind == SLICE:
+            if not isinstance(result, list):
+                return None
+            result = result[arg[0]:arg[1]]
+        else:
+            if isinstance(result, dict):
+                result = list(result.values())
+            elif not isinstance(result, list):
+                return None
+            result = [item for item in result if filter_match(item, arg)]
+
+        if result is None:
+            return None
+
+    return result
+
+
+def apply_jsonpath(data, path):
+    """
+    Apply a JSONPath-like expression to filter JSON data.
+    Supports: $.key, $.key.subkey, $.array[0], $.array[*], $.key[*].subkey,
+    $.array[1:3], $.array[?(@.key==value)]
+    """
+    try:
+        steps = compile(path)
+    except ValueError:
+        return None
+    return apply_steps(data, steps)
+
+
+# ------------------------
+# Streaming Evaluation
+# ------------------------
+#
+# JsonPathStream walks the document as it arrives from the socket and only
+# keeps state for the containers on the path being followed. Matching values
+# are passed to the sink byte for byte as they are read, everything else is
+# skipped. The output is the same JSON apply_jsonpath + json.dumps would give,
+# except values keep the formatting they had in the source document.
+#
+# When a [*] (or a key applied to an array) is reached the evaluator switches
+# to mapping mode and emits one list item per matching element. A path that
+# needs the whole list before continuing, e.g. $.a[*].b[0], captures just that
+# list and finishes it with apply_steps. Filters are tested one element at a
+# time, so only the element being tested is ever held in memory.
+
+_OBJ = 0x7B  # {
+_ARR = 0x5B  # [
+
+# Roles for a value passed over as a whole
+_SKIP = 1
+_EMIT = 2
+_CAPTURE = 3
+_ITEM = 4     # Element of a filtered list, tested once complete
+
+# Lexer states
+_WS = 0
+_STR = 1
+_KEY = 2
+_LIT = 3
+
+_SPACE = b" \t\r\n"
+_LIT_END = b" \t\r\n,]}"
+
+
+def _decode_key(raw):
+    key = bytes(raw).decode()
+    if "\\" in key:
+        return json.loads('"' + key + '"')
+    return key
+
+
+class _Frame:
+    """A container on the path being followed"""
+
+    def __init__(self, kind, pos, is_map):
+        self.kind = kind
+        self.pos = pos          # Step to apply to this container's children
+        self.map = is_map       # Every child is an element of the mapped list
+        self.expect_key = kind == _OBJ
+        self.key = None
+        self.index = 0
+
+
+class JsonPathStream:
+    """Incremental JSONPath evaluator fed with raw JSON bytes"""
+
+    def __init__(self, steps, sink):
+        self.steps = steps
+        self.sink = sink
+        self.frames = []
+        self.mapping = False
+        self.null_if_empty = False
+        self.items = 0
+        self.emitted = False
+        self.raw = None
+        self.raw_depth = 0
+        self.state = _WS
+        self.esc = False
+        self.keybuf = None
+        self.capture = None
+        self.capture_steps = None
+        self.selector = None    # Step choosing the elements of the mapped list
+        self.done = False
+
+    def feed(self, data):
+        if self.done:
+            return
+        view = memoryview(data)
+        n = len(view)
+        i = 0
+        mark = 0  # Start of the raw value bytes in this chunk
+        while i < n:
+            c = view[i]
+            state = self.state
+
+            if state == _STR:
+                if self.esc:
+                    self.esc = False
+                elif c == 0x5C:
+                    self.esc = True
+                elif c == 0x22:
+                    self.state = _WS
+                    if self.raw is not None and self.raw_depth == 0:
+                        # A string value passed over as a whole has ended
+                        i += 1
+                        self._raw_end(view[mark:i])
+                        if self.done:
+                            return
+                        continue
+                i += 1
+                continue
+
+            if state == _KEY:
+                if self.esc:
+                    self.esc = False
+                elif c == 0x5C:
+                    self.esc = True
+                elif c == 0x22:
+                    self.state = _WS
+                    self.frames[-1].key = _decode_key(self.keybuf)
+                    self.keybuf = None
+                    i += 1
+                    continue
+                self.keybuf.append(c)
+                i += 1
+                continue
+
+            if state == _LIT:
+                if c in _LIT_END:
+                    self.state = _WS
+                    if self.raw is not None and self.raw_depth == 0:
+                        self._raw_end(view[mark:i])
+                        if self.done:
+                            return
+                    continue  # The delimiter still belongs to the parent
+                i += 1
+                continue
+
+            if self.raw is not None:
+                # Passing over a whole container, only nesting matters
+                if c == 0x22:
+                    self.state = _STR
+                elif c == 0x7B or c == 0x5B:
+                    self.raw_depth += 1
+                elif c == 0x7D or c == 0x5D:
+                    self.raw_depth -= 1
+                    if self.raw_depth == 0:
+                        i += 1
+                        self._raw_end(view[mark:i])
+                        if self.done:
+                            return
+                        continue
+                i += 1
+                continue
+
+            # Structure of a container on the path
+            if c in _SPACE:
+                i += 1
+                continue
+            frame = self.frames[-1] if self.frames else None
+            if frame is not None and c == 0x2C:
+                if frame.kind == _OBJ:
+                    frame.expect_key = True
+                else:
+                    frame.index += 1
+            elif frame is not None and c == 0x3A:
+                frame.expect_key = False
+            elif frame is not None and (c == 0x7D or c == 0x5D):
+                self._close()
+                if self.done:
+                    return
+            elif frame is not None and frame.expect_key and c == 0x22:
+                if frame.map:
+                    self.state = _STR  # Keys of a mapped object don't matter
+                else:
+                    self.keybuf = bytearray()
+                    self.state = _KEY
+            else:
+                self._value_start(c)
+                if self.done:
+                    return
+                if self.raw is not None:
+                    mark = i
+                    if c == _OBJ or c == _ARR:
+                        self.raw_depth = 1
+                    elif c == 0x22:
+                        self.state = _STR
+                    else:
+                        self.state = _LIT
+            i += 1
+
+        if self.raw is not None and self.raw != _SKIP:
+            self._raw_out(view[mark:n])
+
+    def finish(self):
+        """Complete the output once the whole document has been fed"""
+        if self.done:
+            return
+        if self.raw is not None and self.raw_depth == 0 and self.state == _LIT:
+            self._raw_end(b"")  # Bare scalar at the end of the document
+            if self.done:
+                return
+        if self.mapping:
+            self._end_list()
+        elif not self.emitted:
+            self.sink(b"null")
+        self.done = True
+
+    def _value_start(self, c):
+        """Decide what to do with the value starting with byte c"""
+        frame = self.frames[-1] if self.frames else None
+        if frame is None:
+            pos = 0
+        elif frame.map:
+            kind, arg = self.selector
+            if kind == SLICE:
+                if arg[1] is not None and frame.index >= arg[1]:
+                    # Past the end of the slice, nothing more to read
+                    self._end_list()
+                    self.done = True
+                    return
+                if arg[0] is not None and frame.index < arg[0]:
+                    self.raw = _SKIP
+                    return
+            elif kind == FILTER:
+                self.capture = bytearray()
+                self.raw = _ITEM
+                return
+            pos = 0
+        else:
+            kind, arg = self.steps[frame.pos]
+            if frame.kind == _OBJ:
+                child = frame.key
+            else:
+                child = frame.index
+            pos = frame.pos + 1 if child == arg else None
+
+        if pos is None:
+            self.raw = _SKIP
+            return
+        self._arrive(c, pos)
+
+    def _arrive(self, c, pos):
+        """The value starting with c is reached after pos steps"""
+        steps = self.steps
+        if pos == len(steps):
+            self._item()
+            self.raw = _EMIT
+            return
+
+        kind, arg = steps[pos]
+        if self.mapping:
+            # Elements are followed by keys only, anything else drops the element
+            if c == _OBJ and kind == KEY:
+                self.frames.append(_Frame(_OBJ, pos, False))
+            else:
+                self.raw = _SKIP
+            return
+
+        if c == _OBJ and kind == KEY:
+            self.frames.append(_Frame(c, pos, False))
+        elif c == _ARR and kind == INDEX:
+            if arg >= 0:
+                self.frames.append(_Frame(c, pos, False))
+            else:
+                self._capture(pos)  # Counted from the end, needs the whole list
+        elif c == _ARR and kind == KEY:
+            # A key applied to an array maps over its elements
+            self._start_map(c, pos, (WILD, None), steps[pos:])
+        elif (c == _OBJ or c == _ARR) and (kind == WILD or kind == FILTER):
+            self._start_map(c, pos, steps[pos], steps[pos + 1:])
+        elif c == _ARR and kind == SLICE:
+            if (arg[0] or 0) >= 0 and (arg[1] or 0) >= 0:
+                self._start_map(c, pos, steps[pos], steps[pos + 1:])
+            else:
+                self._capture(pos)
+        else:
+            self._result_null()
+
+    def _start_map(self, c, pos, selector, rest):
+        # [*] applied to the mapped list is a no-op
+        rest = [step for step in rest if step[0] != WILD]
+        for step in rest:
+            if step[0] != KEY:
+                # Applies to the mapped list as a whole
+                self._capture(pos)
+                return
+        self.steps = rest
+        self.selector = selector
+        self.mapping = True
+        self.null_if_empty = len(rest) > 0
+        self.frames.append(_Frame(c, 0, True))
+
+    def _capture(self, pos):
+        """Collect the value and finish it with apply_steps"""
+        self.capture = bytearray()
+        self.capture_steps = self.steps[pos:]
+        self.raw = _CAPTURE
+
+    def _close(self):
+        frame = self.frames.pop()
+        if frame.map:
+            self._end_list()
+            self.done = True
+        elif not self.mapping:
+            # Closed without finding the next step
+            self._result_null()
+
+    def _item(self):
+        """Start the next result value"""
+        if self.mapping:
+            self.sink(b"[" if self.items == 0 else b", ")
+            self.items += 1
+        self.emitted = True
+
+    def _end_list(self):
+        if self.items:
+            self.sink(b"]")
+        else:
+            self.sink(b"null" if self.null_if_empty else b"[]")
+
+    def _result_null(self):
+        self.sink(b"null")
+        self.emitted = True
+        self.done = True
+
+    def _raw_out(self, data):
+        if self.raw == _EMIT:
+            self.sink(data)
+        else:
+            self.capture.extend(data)
+
+    def _raw_end(self, data):
+        raw = self.raw
+        self.raw = None
+        if raw == _SKIP:
+            return
+        if raw == _EMIT:
+            if data:
+                self.sink(data)
+            if not self.mapping:
+                self.done = True
+            return
+
+        self.capture.extend(data)
+        value = json.loads(self.capture.decode())
+        self.capture = None
+        if raw == _ITEM:
+            if not filter_match(value, self.selector[1]):
+                return
+            # Follow the remaining keys within the element
+            for _, key in self.steps:
+                if not isinstance(value, dict) or key not in value:
+                    return
+                value = value[key]
+            self._item()
+            self.sink(json.dumps(value).encode())
+            return
+
+        self.sink(json.dumps(apply_steps(value, self.capture_steps)).encode())
+        self.emitted = True
+        self.done = True
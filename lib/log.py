@@ -0,0 +1,75 @@
+# MicroPython imports
+import sys
+from micropython import const
+
+# ------------------------
+# Console Log
+# ------------------------
+#
+# What the proxy writes to its console (stderr), chosen with the DEBUG
+# command. Callers test the level before building a message, so a level
+# that is off costs a comparison. The hot paths in slapi.py also test the
+# LOGGING constant there, which compiles them out of a build without logs.
+
+OFF = const(0)
+ERROR = const(1)    # Errors sent to the client
+INFO = const(2)     # Lines from the client and the answers to commands
+DEBUG = const(3)    # The stages of each request, and response headers
+TRACE = const(4)    # Every byte written to the link, and request bodies
+
+NAMES = ("OFF", "ERROR", "INFO", "DEBUG", "TRACE")
+
+# Headers whose values are never logged, in lower case
+SECRET_HEADERS = (b"authorization", b"proxy-authorization", b"cookie", b"set-cookie", b"x-api-key")
+HIDDEN = b"***"
+
+level = INFO
+_last = None    # Last byte written, to start a new line after a lone CR
+
+
+def set_level(name):
+    """Set the level by name, DEBUG ON is DEBUG. False if name isn't a level"""
+    global level
+    name = "DEBUG" if name == "ON" else name
+    if name not in NAMES:
+        return False
+    level = NAMES.index(name)
+    return True
+
+
+def level_name():
+    return NAMES[level]
+
+
+def write(data):
+    """Write to the console as is, the caller has checked the level"""
+    global _last
+    if not data:
+        return
+    if _last == 0x0D and data[0] != 0x0A:
+        sys.stderr.write("\n")
+    sys.stderr.buffer.write(data)
+    _last = data[-1]
+
+
+def redact(line):
+    """
+    line with the value of a secret header hidden. Covers "Name: value"
+    header lines and the command "HEADERS Name value".
+    """
+    lower = bytes(line).lower()
+    if lower.startswith(b"headers "):
+        start = 8
+        end = lower.find(b" ", start)
+    else:
+        start = 0
+        end = lower.find(b":")
+    if end < 0 or lower[start:end].strip() not in SECRET_HEADERS:
+        return line
+    # Keep the separator, a space after a colon
+    return bytes(line[:end + 1]) + (HIDDEN if start else b" " + HIDDEN)
+
+
+def redact_lines(block):
+    """redact for each line of a CRLF separated block"""
+    return b"\r\n".join(redact(line) for line in block.split(b"\r\n"))
@@ -0,0 +1,113 @@
+# ------------------------
+# LZSS Link Compression
+# ------------------------
+#
+# Body encoding for COMPRESS LZSS, chosen so a Z80 can decode it as it
+# arrives with a 1K ring buffer and no multiplies (see cpm/asm/lzss.inc).
+#
+# The body is sent as frames, each a 16-bit little endian length followed by
+# that many bytes of LZSS data, and ends with a zero length frame. Inside a
+# frame a flag byte precedes each group of up to eight items, LSB first:
+#   1 = literal byte
+#   0 = match of two bytes,
+#       byte 0 = distance-1 bits 0-7
+#       byte 1 = distance-1 bits 8-9 in bits 6-7, length-3 in bits 0-5
+# A frame always ends on a whole item, any flag bits left over are unused.
+# Data that doesn't compress is sent as a stored frame instead, with bit 15 of
+# the length set and the bytes as they are. The window carries over from
+# frame to frame within one body.
+
+WINDOW = 1024
+MIN_MATCH = 3
+MAX_MATCH = 66
+BLOCK = 512         # Raw bytes encoded per frame
+HASH_SIZE = 1024
+
+
+class Encoder:
+    """Compresses a body, passing whole frames on to sink()"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.hist = bytearray()     # Last WINDOW bytes, then the pending block
+        self.base = 0               # Body offset of hist[0]
+        self.pending = 0            # Bytes at the end of hist not yet encoded
+        self.head = [-1] * HASH_SIZE
+        self.raw = 0
+        self.sent = 0
+
+    def feed(self, data):
+        self.hist.extend(data)
+        self.pending += len(data)
+        self.raw += len(data)
+        while self.pending >= BLOCK:
+            self._frame(BLOCK)
+
+    def flush(self):
+        """Pending bytes wait for a whole BLOCK, short frames would cost ratio"""
+        pass
+
+    def finish(self):
+        """Encode what is left and send the end of body frame"""
+        if self.pending:
+            self._frame(self.pending)
+        self.sink(b"\x00\x00")
+        self.sent += 2
+
+    def _frame(self, count):
+        hist = self.hist
+        head = self.head
+        base = self.base
+        i = len(hist) - self.pending
+        end = i + count
+        out = bytearray(b"\x00\x00")
+        flag_pos = 0
+        bit = 8
+        while i < end:
+            if bit == 8:
+                flag_pos = len(out)
+                out.append(0)
+                bit = 0
+            length = 0
+            if end - i >= MIN_MATCH:
+                h = ((hist[i] << 5) ^ (hist[i + 1] << 2) ^ hist[i + 2]) & (HASH_SIZE - 1)
+                cand = head[h] - base
+                head[h] = base + i
+                dist = i - cand
+                if cand >= 0 and dist <= WINDOW:
+                    limit = min(MAX_MATCH, end - i)
+                    while length < limit and hist[cand + length] == hist[i + length]:
+                        length += 1
+            if length >= MIN_MATCH:
+                dist -= 1
+                out.append(dist & 0xFF)
+                out.append((dist >> 8) << 6 | (length - MIN_MATCH))
+                # Index the positions inside the match too, later data often repeats them
+                nxt = i + length
+                for j in range(i + 1, min(nxt, end - MIN_MATCH + 1)):
+                    head[((hist[j] << 5) ^ (hist[j + 1] << 2) ^ hist[j + 2]) & (HASH_SIZE - 1)] = base + j
+                i = nxt
+            else:
+                out[flag_pos] |= 1 << bit
+                out.append(hist[i])
+                i += 1
+            bit += 1
+
+        size = len(out) - 2
+        if size > count:
+            # Stored frame
+            start = len(hist) - self.pending
+            out = bytearray(2)
+            out.extend(hist[start:start + count])
+            size = count | 0x8000
+        out[0] = size & 0xFF
+        out[1] = size >> 8
+        self.pending -= count
+        self.sent += len(out)
+        self.sink(out)
+
+        # Keep only the window for the next frame
+        drop = len(hist) - self.pending - WINDOW
+        if drop > 0:
+            self.hist = hist[drop:]
+            self.base += drop
@@ -1,7 +1,10 @@
+import stats
+stats.mark("main")
+
 from env import read_env
-from wifi import connect_wifi
 from slapi import start_slapi
 
 env = read_env()
-connect_wifi(env.get('SSID',''),  env.get('PASSWORD',''))
-start_slapi()
+stats.mark("loaded")
+# READY goes out as soon as the link is up, Wi-Fi joins in the background
+start_slapi(env.get('SSID',''),  env.get('PASSWORD',''))
@@ -0,0 +1,107 @@
+# MicroPython imports
+import asyncio
+
+import body_pump
+
+# ------------------------
+# Multiplexed Channels
+# ------------------------
+#
+# After MUX ON both directions of the link carry frames: a channel number,
+# a 16-bit little endian length, then that many bytes. Inside a channel the
+# client speaks the usual line protocol, and each channel works through its
+# requests in order while the channels run side by side. Answers are cut
+# into frames of at most FRAME_SIZE bytes, so a long response only delays
+# another channel by one frame. A zero length frame from the proxy ends the
+# answer to one request or command.
+#
+# Output is routed by task: while a channel's task runs, transport_write
+# collects into that channel's buffer instead of writing the link.
+
+MAX_CHANNELS = 4
+FRAME_SIZE = 256
+PIPE_SIZE = 1024    # Each channel has its own, smaller, body pump
+
+# Task -> Channel, for the tasks answering a channel
+routes = {}
+
+# Held while a frame is written, so frames never interleave on the link
+lock = asyncio.Lock()
+
+
+def current():
+    """The channel the running task answers on, or None"""
+    if not routes:
+        return None
+    return routes.get(asyncio.current_task())
+
+
+class FrameReader:
+    """Splits the bytes from the client into (channel, payload) frames"""
+
+    def __init__(self):
+        self.buf = b""
+
+    def feed(self, data):
+        self.buf += data
+        frames = []
+        while len(self.buf) >= 3:
+            size = self.buf[1] | self.buf[2] << 8
+            if len(self.buf) < 3 + size:
+                break
+            frames.append((self.buf[0], self.buf[3:3 + size]))
+            self.buf = self.buf[3 + size:]
+        return frames
+
+
+class Channel:
+    """One logical connection over the link"""
+
+    def __init__(self, cid, state):
+        self.cid = cid
+        self.state = state      # This channel's settings, a copy of the proxy's when it opened
+        self.partial = b""      # Input after the last complete line
+        self.lines = []         # Complete lines not yet taken as an item
+        self.items = []         # Items waiting to be handled
+        self.out = bytearray(FRAME_SIZE)
+        self.out_len = 0
+        self.pump = body_pump.Pump(PIPE_SIZE)
+        self.encoder = None     # LZSS encoder of the body being sent
+        self.task = None
+
+    def feed(self, data):
+        """Add input, splitting it into lines"""
+        data = self.partial + data
+        start = 0
+        while True:
+            end = data.find(b"\r\n", start)
+            if end < 0:
+                break
+            self.lines.append(str(data[start:end], "utf-8"))
+            start = end + 2
+        self.partial = data[start:]
+
+    def collect(self, data):
+        """transport_write while this channel's task runs"""
+        end = self.out_len + len(data)
+        if end > len(self.out):
+            self.out.extend(bytes(end - len(self.out)))
+        self.out[self.out_len:end] = data
+        self.out_len = end
+
+    async def flush(self, write):
+        """Send the collected output as frames"""
+        view = memoryview(self.out)
+        pos = 0
+        while pos < self.out_len:
+            n = min(FRAME_SIZE, self.out_len - pos)
+            async with lock:
+                await write(bytes((self.cid, n & 0xFF, n >> 8)))
+                await write(view[pos:pos + n])
+            pos += n
+        self.out_len = 0
+
+    async def end(self, write):
+        """Mark the end of an answer"""
+        async with lock:
+            await write(bytes((self.cid, 0, 0)))
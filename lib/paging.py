@@ -0,0 +1,192 @@
+# MicroPython imports
+import os
+
+# ------------------------
+# Paged Responses
+# ------------------------
+#
+# With RESPONSE WINDOW offset,length only that slice of each response body
+# goes to the client. The whole body is kept in a Spool, in RAM and then on
+# flash once it outgrows MAX_RAM, so NEXT can send the following page without
+# asking the server again. When nothing else needs the whole body the proxy
+# asks the server for just the window with a Range request, and NEXT asks
+# for the next range.
+#
+# The window applies to the body the client would otherwise receive, after
+# inflating and JSONPath.
+
+MAX_RAM = 8 * 1024          # Spools larger than this move to flash
+MAX_FLASH = 128 * 1024      # Larger bodies are not kept, later pages are fetched again
+SPOOL_FILE = "/page{}.bin"
+
+# The Window of the last paged response, NEXT continues from it
+last = None
+_next_file = 0
+
+
+class Spool:
+    """A response body kept for later pages"""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.file = None
+        self.path = None
+        self.size = 0
+
+    def write(self, data):
+        """Add to the body. Returns False when it has grown too large to keep"""
+        global _next_file
+        self.size += len(data)
+        if self.size > MAX_FLASH:
+            return False
+        if self.buf is not None and self.size <= MAX_RAM:
+            self.buf.extend(data)
+            return True
+        try:
+            if self.file is None:
+                # Move what is held so far to flash
+                self.path = SPOOL_FILE.format(_next_file)
+                _next_file += 1
+                self.file = open(self.path, "wb")
+                self.file.write(self.buf)
+                self.buf = None
+            self.file.write(data)
+        except OSError:
+            return False
+        return True
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def read(self, start, end, buf):
+        """Yield the body from start up to end in pieces, buf is used for reading flash"""
+        end = min(end, self.size)
+        if self.buf is not None:
+            view = memoryview(self.buf)
+            for i in range(start, end, len(buf)):
+                yield view[i:min(i + len(buf), end)]
+            return
+        view = memoryview(buf)
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            while start < end:
+                n = f.readinto(view[:min(len(buf), end - start)])
+                if not n:
+                    break
+                start += n
+                yield view[:n]
+
+    def drop(self):
+        self.close()
+        self.buf = None
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+
+def parse_content_range(value):
+    """(first, total) from a Content-Range value, total is None when unknown"""
+    value = value.strip()
+    if not value.startswith("bytes "):
+        raise ValueError("Unsupported Content-Range")
+    span, total = value[6:].split("/", 1)
+    first = int(span.split("-", 1)[0])
+    return first, None if total.strip() == "*" else int(total)
+
+
+class Window:
+    """The page of one response sent to the client"""
+
+    def __init__(self, offset, length, request):
+        self.offset = offset
+        self.length = length
+        self.request = request      # (method, path, headers, body), repeated for pages not held
+        self.status_line = None     # Set once a response is being paged
+        self.headers = None
+        self.pos = 0                # Body bytes seen
+        self.total = None           # Body size, once known
+        self.ranged = False         # The server sent only the window
+        self.spool = None
+        self.source = None          # JSONPath evaluator writing to the window
+
+    def end(self):
+        return self.offset + self.length
+
+    def range_header(self):
+        return f"bytes={self.offset}-{self.end() - 1}"
+
+    def begin(self, status_line, headers, content_range=None):
+        """A response is starting, content_range is set when the server sent a range"""
+        self.status_line = status_line
+        self.headers = headers
+        if content_range is not None:
+            self.pos, self.total = parse_content_range(content_range)
+            self.ranged = True
+        else:
+            self.spool = Spool()
+
+    def wrap(self, out):
+        """Sink that keeps the body and passes the window on to out"""
+
+        def sink(data):
+            start = self.pos
+            self.pos += len(data)
+            if self.spool is not None and not self.spool.write(data):
+                self.spool.drop()
+                self.spool = None
+            lo = max(self.offset - start, 0)
+            hi = min(self.end() - start, len(data))
+            if lo < hi:
+                out(data[lo:hi])
+        return sink
+
+    @property
+    def done(self):
+        """Nothing more of the body is needed, so reading can stop"""
+        if self.source is not None and self.source.done:
+            return True
+        return self.spool is None and self.pos >= self.end()
+
+    def finish(self, complete):
+        if self.spool is not None:
+            self.spool.close()
+        if complete and not self.ranged:
+            self.total = self.pos
+
+    def next(self):
+        """The Window for the following page, holding the body if it is kept"""
+        page = Window(self.end(), self.length, self.request)
+        page.total = self.total
+        spool = self.spool
+        if spool is not None and (self.total is not None or spool.size >= page.end()):
+            page.status_line, page.headers = self.status_line, self.headers
+            page.spool, self.spool = spool, None
+        return page
+
+    def drop(self):
+        if self.spool is not None:
+            self.spool.drop()
+            self.spool = None
+
+
+def keep(window):
+    """Make window the one NEXT continues from, if a response was paged"""
+    global last
+    if window.status_line is None:
+        window.drop()
+        return
+    if last is not None and last is not window:
+        last.drop()
+    last = window
+
+
+def clear():
+    global last
+    if last is not None:
+        last.drop()
+    last = None
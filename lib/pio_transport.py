@@ -0,0 +1,283 @@
+# MicroPython imports
+from machine import Pin, mem32
+import rp2
+from rp2 import PIO, StateMachine, asm_pio
+import utime as time
+
+from transport import Transport
+
+# ------------------------
+# PIO Parallel Interface
+# ------------------------
+#
+# Same wiring and VALID/ACK handshake as the GPIO transport (see GPIO
+# protocol.md), run by PIO state machines instead of Python loops. One state
+# machine sends and one receives, and only the one for the current direction
+# runs. Writes are fed to the TX FIFO by DMA when the port has rp2.DMA, and
+# reads are taken from the RX FIFO.
+#
+# The data pins must be consecutive GPIOs, DATA_PINS[0] being bit 0. VALID and
+# ACK can be any pins.
+
+SM_TX = 0
+SM_RX = 1
+FREQ = 10_000_000           # 100ns per instruction, plenty of setup time
+
+PIO0_BASE = 0x50200000
+PIO_BLOCK_SIZE = 0x100000   # PIO1 follows PIO0
+FDEBUG = 0x008
+TXF0 = 0x010
+FDEBUG_TXSTALL = 24
+
+
+# Sender, ACK is the in pin and VALID the set pin. Each byte is driven whole.
+@asm_pio(out_init=(PIO.OUT_LOW,) * 8, set_init=PIO.OUT_LOW, out_shiftdir=PIO.SHIFT_RIGHT)
+def _tx8():
+    wrap_target()
+    pull(block)
+    wait(0, pin, 0)             # Receiver ready
+    out(pins, 8)            [3]
+    set(pins, 1)                # VALID high
+    wait(1, pin, 0)             # Data taken
+    set(pins, 0)                # VALID low
+    wrap()
+
+
+# Receiver, VALID is the jmp pin and ACK the set pin
+@asm_pio(set_init=PIO.OUT_LOW, in_shiftdir=PIO.SHIFT_LEFT)
+def _rx8():
+    wrap_target()
+    label("resync")
+    jmp(pin, "resync")          # Wait for VALID low
+    set(pins, 0)                # ACK low
+    label("idle")
+    jmp(pin, "valid")
+    jmp("idle")
+    label("valid")
+    in_(pins, 8)
+    push(block)
+    set(pins, 1)                # ACK high
+    wrap()
+
+
+# As _tx8, sending the high nibble then the low nibble. DMA and put() place
+# the byte in the top of the word, so shifting left sends it high bits first.
+@asm_pio(out_init=(PIO.OUT_LOW,) * 4, set_init=PIO.OUT_LOW, out_shiftdir=PIO.SHIFT_LEFT, pull_thresh=8)
+def _tx4():
+    wrap_target()
+    pull(block)
+    label("nibble")
+    wait(0, pin, 0)
+    out(pins, 4)            [3]
+    set(pins, 1)
+    wait(1, pin, 0)
+    set(pins, 0)
+    jmp(not_osre, "nibble")
+    wrap()
+
+
+@asm_pio(set_init=PIO.OUT_LOW, in_shiftdir=PIO.SHIFT_LEFT)
+def _rx4():
+    wrap_target()
+    set(x, 1)                   # Two nibbles per byte
+    label("nibble")
+    jmp(pin, "nibble")          # Wait for VALID low
+    set(pins, 0)
+    label("idle")
+    jmp(pin, "valid")
+    jmp("idle")
+    label("valid")
+    in_(pins, 4)
+    set(pins, 1)
+    jmp(x_dec, "nibble")
+    push(block)
+    wrap()
+
+
+class PIOParallel(Transport):
+    """
+    PIO-based parallel transport base class.
+    """
+
+    MODE = None
+    DATA_WIDTH = None
+    TX_PROGRAM = None
+    RX_PROGRAM = None
+
+    def __init__(self, data_pins, valid_pin, ack_pin, timeout_ms, min_hold_time_ms):
+        if self.MODE is None or self.DATA_WIDTH is None:
+            raise ValueError("PIOParallel base class cannot be instantiated directly")
+
+        if len(data_pins) != self.DATA_WIDTH:
+            raise ValueError(
+                "{} mode requires {} data pins".format(self.MODE, self.DATA_WIDTH)
+            )
+        if list(data_pins) != list(range(data_pins[0], data_pins[0] + self.DATA_WIDTH)):
+            raise ValueError("{} mode requires consecutive data pins".format(self.MODE))
+
+        self.mode = self.MODE
+        self.data_pins = data_pins
+        self.valid_pin = valid_pin
+        self.ack_pin = ack_pin
+
+        self.TIMEOUT_MS = timeout_ms
+        self.MIN_HOLD_TIME_MS = min_hold_time_ms
+
+        self.tx = StateMachine(SM_TX)
+        self.rx = StateMachine(SM_RX)
+        pio = SM_TX // 4
+        pio_base = PIO0_BASE + pio * PIO_BLOCK_SIZE
+        self.fdebug = pio_base + FDEBUG
+        self.txf = pio_base + TXF0 + (SM_TX % 4) * 4
+        self.stall_bit = 1 << (FDEBUG_TXSTALL + SM_TX % 4)
+
+        self.dma = None
+        if hasattr(rp2, "DMA"):
+            self.dma = rp2.DMA()
+            # Byte writes to the FIFO are replicated across the word, which
+            # suits both programs
+            self.dma_ctrl = self.dma.pack_ctrl(size=0, inc_write=False, treq_sel=pio * 8 + SM_TX % 4)
+
+        self.writing = False
+        self._start_rx()
+
+    def _start_tx(self):
+        self.rx.active(0)
+        Pin(self.ack_pin, Pin.IN, Pin.PULL_UP)
+        self.tx.init(
+            self.TX_PROGRAM,
+            freq=FREQ,
+            out_base=Pin(self.data_pins[0]),
+            set_base=Pin(self.valid_pin),
+            in_base=Pin(self.ack_pin),
+        )
+        self.tx.active(1)
+        self.writing = True
+
+    def _start_rx(self):
+        self.tx.active(0)
+        for p in self.data_pins:
+            Pin(p, Pin.IN, Pin.PULL_UP)
+        Pin(self.valid_pin, Pin.IN, Pin.PULL_UP)
+        self.rx.init(
+            self.RX_PROGRAM,
+            freq=FREQ,
+            in_base=Pin(self.data_pins[0]),
+            set_base=Pin(self.ack_pin),
+            jmp_pin=Pin(self.valid_pin),
+        )
+        self.rx.active(1)
+        self.writing = False
+
+    def _check_timeout(self, start, what):
+        if self.TIMEOUT_MS != 0 and time.ticks_diff(time.ticks_ms(), start) > self.TIMEOUT_MS:
+            raise RuntimeError("Timeout waiting for {}".format(what))
+
+    def _flush(self):
+        """Wait until the last byte has been acknowledged"""
+        # The stall flag is sticky. Once everything is queued it can only be
+        # set again by the sender running out of bytes
+        mem32[self.fdebug] = self.stall_bit
+        start = time.ticks_ms()
+        while not mem32[self.fdebug] & self.stall_bit:
+            self._check_timeout(start, "ACK signal")
+
+    def set_write_mode(self):
+        if not self.writing:
+            self._start_tx()
+        time.sleep_ms(self.MIN_HOLD_TIME_MS)  # hold valid low for the other end to change direction
+
+    def set_read_mode(self):
+        if self.writing:
+            self._flush()
+            self._start_rx()
+
+    def any(self):
+        return not self.writing and self.rx.rx_fifo() > 0
+
+    def write(self, data):
+        """Queue data for sending (compatible with UART interface)"""
+        if isinstance(data, str):
+            data = data.encode()
+        if not data:
+            return 0
+
+        start = time.ticks_ms()
+        if self.dma is not None:
+            left = len(data)
+            self.dma.config(read=data, write=self.txf, count=left, ctrl=self.dma_ctrl, trigger=True)
+            while self.dma.active():
+                if self.dma.count != left:
+                    left = self.dma.count
+                    start = time.ticks_ms()
+                    continue
+                try:
+                    self._check_timeout(start, "ACK signal")
+                except RuntimeError:
+                    self.dma.active(0)
+                    raise
+        else:
+            for byte in data:
+                while self.tx.tx_fifo() >= 4:
+                    self._check_timeout(start, "ACK signal")
+                self.tx.put(byte, 24 if self.DATA_WIDTH == 4 else 0)
+        # The last few bytes are still going out from the FIFO, set_read_mode waits for them
+        return len(data)
+
+    def read(self, size=1):
+        """Read data (compatible with UART interface)"""
+        result = bytearray()
+        start = time.ticks_ms()
+        while len(result) < size:
+            if self.rx.rx_fifo():
+                result.append(self.rx.get() & 0xFF)
+                start = time.ticks_ms()
+            else:
+                self._check_timeout(start, "VALID signal")
+        return bytes(result)
+
+    def write_from(self, buf):
+        """The DMA reads straight from the buffer, so this is write()"""
+        return self.write(buf)
+
+    def readinto(self, buf):
+        """Wait for the first byte, then take whatever else is queued in the FIFO"""
+        n = 0
+        size = len(buf)
+        start = time.ticks_ms()
+        while n < size:
+            if self.rx.rx_fifo():
+                buf[n] = self.rx.get() & 0xFF
+                n += 1
+            elif n:
+                break
+            else:
+                self._check_timeout(start, "VALID signal")
+        return self._filter_flow(buf, n)
+
+    def init(self, **kwargs):
+        """Reconfigure interface (for compatibility with UART)"""
+        # PIO mode doesn't support reconfiguration like UART
+        pass
+
+    def cleanup(self):
+        """Stop the state machines and release the DMA channel"""
+        self.tx.active(0)
+        self.rx.active(0)
+        if self.dma is not None:
+            self.dma.close()
+            self.dma = None
+
+
+class PIO8Bit(PIOParallel):
+    MODE = "8bit"
+    DATA_WIDTH = 8
+    TX_PROGRAM = _tx8
+    RX_PROGRAM = _rx8
+
+
+class PIO4Bit(PIOParallel):
+    MODE = "4bit"
+    DATA_WIDTH = 4
+    TX_PROGRAM = _tx4
+    RX_PROGRAM = _rx4
@@ -0,0 +1,109 @@
+# MicroPython imports
+import time
+
+# ------------------------
+# Scheduled Prefetch
+# ------------------------
+#
+# PREFETCH registers a GET that the proxy repeats every interval while the
+# client is idle. Each refresh goes through the response cache, so a later
+# matching request is a cache hit and doesn't wait on the network. The
+# DOMAIN, JSONPath, HTTP/HTTPS choice and HEADERS in effect when the job was
+# registered are used for every refresh, so the refresh is stored under the
+# cache key of the registered request, and a filtered request finds its
+# result already computed.
+
+MAX_JOBS = 8
+MIN_INTERVAL = 5    # Seconds
+FRESH_FACTOR = 2    # Stored copies stay fresh this many intervals, in case a refresh is held up by a busy client
+
+# Jobs in the order they were registered
+jobs = []
+
+
+class Job:
+    """A request repeated in the background"""
+
+    def __init__(self, domain, path, steps, expr, use_ssl, headers, interval):
+        self.domain = domain
+        self.path = path
+        self.steps = steps          # Compiled JSONPath, or None
+        self.expr = expr
+        self.use_ssl = use_ssl      # As set by HTTPS/HTTP, None to follow DOMAIN
+        self.headers = headers      # Default headers, a copy
+        self.interval = interval
+        self.key = None             # Response cache key, known after the first run
+        self.next_run = time.ticks_ms()
+        self.refreshes = 0
+        self.failures = 0
+        self.hits = 0
+
+    def lifetime(self):
+        return self.interval * FRESH_FACTOR
+
+    def matches(self, domain, path, expr):
+        return self.domain == domain and self.path == path and self.expr == expr
+
+
+def add(domain, path, steps, expr, use_ssl, headers, interval):
+    """Register a job, replacing one for the same request. Returns False when full"""
+    remove(domain, path, expr)
+    if len(jobs) >= MAX_JOBS:
+        return False
+    jobs.append(Job(domain, path, steps, expr, use_ssl, headers.copy(), interval))
+    return True
+
+
+def remove(domain, path, expr):
+    for job in jobs:
+        if job.matches(domain, path, expr):
+            jobs.remove(job)
+            return
+
+
+def clear():
+    jobs.clear()
+
+
+def due():
+    """The job most overdue, or None if none is due yet"""
+    now = time.ticks_ms()
+    best = None
+    for job in jobs:
+        if time.ticks_diff(now, job.next_run) >= 0:
+            if best is None or time.ticks_diff(best.next_run, job.next_run) > 0:
+                best = job
+    return best
+
+
+def finished(job, refreshed):
+    """Schedule the next run after job has run"""
+    job.next_run = time.ticks_add(time.ticks_ms(), job.interval * 1000)
+    if refreshed:
+        job.refreshes += 1
+    else:
+        job.failures += 1
+
+
+def count_hit(key):
+    """A request was answered from a cached copy stored under key"""
+    for job in jobs:
+        if job.key == key:
+            job.hits += 1
+
+
+def report(peek):
+    """Lines for the PREFETCH command, peek(key) gives the cached entry"""
+    if not jobs:
+        return ["(no prefetch jobs)"]
+    lines = []
+    now = time.ticks_ms()
+    for job in jobs:
+        entry = peek(job.key) if job.key is not None else None
+        age = f"{time.ticks_diff(now, entry.updated) // 1000}s" if entry is not None else "-"
+        expr = f" {job.expr}" if job.expr else ""
+        lines.append(
+            f"{job.interval}s {job.domain}{job.path}{expr} age={age} hits={job.hits} "
+            f"refreshes={job.refreshes} failures={job.failures}"
+        )
+    return lines
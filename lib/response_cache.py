@@ -0,0 +1,366 @@
+# MicroPython imports
+import os
+import time
+
+# ------------------------
+# HTTP Response Cache
+# ------------------------
+#
+# Optional cache of complete GET responses, off until CACHE ON. Entries are
+# fresh for Cache-Control max-age and are revalidated with If-None-Match /
+# If-Modified-Since after that. Bodies live in RAM, or with CACHE FLASH large
+# bodies are written to files under CACHE_DIR instead. Each store is kept
+# within its byte budget by evicting the least recently used entries.
+#
+# Alongside each entry is a second tier keyed by JSONPath expression holding
+# the already filtered and serialized result, so a repeated filtered request
+# is answered without parsing anything. It is kept even when the body itself
+# is too large to cache, and goes with the entry when a changed response
+# replaces it.
+
+RAM_BUDGET = 32 * 1024
+FLASH_BUDGET = 256 * 1024
+MAX_RAM_ENTRY = 16 * 1024     # Larger bodies are only cached on flash
+MAX_FLASH_ENTRY = 96 * 1024
+MAX_FILTERED = 4 * 1024       # Largest JSONPath result kept
+MAX_FILTERED_PER_ENTRY = 4    # JSONPath results kept per entry
+CACHE_DIR = "/cache"
+
+# Request headers that change the response, part of the cache key
+KEY_HEADERS = ("accept", "accept-encoding", "accept-language", "authorization")
+
+enabled = False
+use_flash = False
+
+# key -> Entry
+_entries = {}
+_next_file = 0
+
+stats = {
+    "hits": 0,
+    "filtered_hits": 0,
+    "misses": 0,
+    "revalidated": 0,
+    "stored": 0,
+    "evicted": 0,
+}
+
+
+class Entry:
+    """A cached response"""
+
+    def __init__(self, status_line, headers, content_type, etag, last_modified, max_age):
+        self.status_line = status_line
+        self.headers = headers          # Header lines as forwarded to the client
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = None                # bytearray when held in RAM
+        self.path = None                # File name when spilled to flash
+        self.size = 0
+        self.filtered = {}              # JSONPath expression -> result bytes
+        self.hits = 0
+        self.refresh(max_age)
+
+    def refresh(self, max_age):
+        """Restart the freshness lifetime, after storing or a 304"""
+        now = time.ticks_ms()
+        self.expires = time.ticks_add(now, max_age * 1000)
+        self.last_used = now
+        self.updated = now              # When the server last confirmed the body
+
+    def has_body(self):
+        return self.body is not None or self.path is not None
+
+    def ram_bytes(self):
+        size = self.size if self.body is not None else 0
+        for result in self.filtered.values():
+            size += len(result)
+        return size
+
+    def fresh(self):
+        return time.ticks_diff(self.expires, time.ticks_ms()) > 0
+
+    def age(self):
+        """Seconds until expiry, negative once stale"""
+        return time.ticks_diff(self.expires, time.ticks_ms()) // 1000
+
+    def chunks(self, buf):
+        """Yield the body in pieces, buf is used for reading flash"""
+        if self.body is not None:
+            view = memoryview(self.body)
+            for i in range(0, self.size, len(buf)):
+                yield view[i:i + len(buf)]
+            return
+        view = memoryview(buf)
+        with open(self.path, "rb") as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                yield view[:n]
+
+    def drop(self):
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def make_key(method, host, port, path, headers):
+    key = f"{method} {host}:{port}{path}"
+    for name in KEY_HEADERS:
+        if name in headers:
+            key += f"\n{name}:{headers[name]}"
+    return key
+
+
+def parse_policy(header_lines, min_age=0):
+    """
+    Read caching headers from a response. min_age extends the lifetime, for
+    responses the proxy fetched itself (PREFETCH).
+    Returns (storable, max_age, etag, last_modified).
+    """
+    max_age = 0
+    storable = True
+    etag = None
+    last_modified = None
+    for line in header_lines:
+        line_lower = line.lower()
+        if line_lower.startswith(b"cache-control"):
+            for directive in line_lower.split(b":", 1)[1].split(b","):
+                directive = directive.strip()
+                if directive == b"no-store":
+                    storable = False
+                elif directive == b"no-cache":
+                    max_age = 0
+                elif directive.startswith(b"max-age="):
+                    try:
+                        max_age = int(directive[8:])
+                    except ValueError:
+                        pass
+        elif line_lower.startswith(b"etag"):
+            etag = line.split(b":", 1)[1].strip().decode()
+        elif line_lower.startswith(b"last-modified"):
+            last_modified = line.split(b":", 1)[1].strip().decode()
+        elif line_lower.startswith(b"vary"):
+            for name in line_lower.split(b":", 1)[1].split(b","):
+                if name.strip().decode() not in KEY_HEADERS:
+                    storable = False
+    max_age = max(max_age, min_age)
+    # Without a lifetime or a validator the entry could never be used
+    if max_age <= 0 and etag is None and last_modified is None:
+        storable = False
+    return storable, max_age, etag, last_modified
+
+
+def lookup(key):
+    """Cached entry for key, fresh or not, or None"""
+    entry = _entries.get(key)
+    if entry is None:
+        stats["misses"] += 1
+        return None
+    entry.last_used = time.ticks_ms()
+    return entry
+
+
+def peek(key):
+    """Cached entry for key, without counting it as a lookup"""
+    return _entries.get(key)
+
+
+def conditional_headers(entry):
+    """Validator headers for revalidating a stale entry"""
+    headers = {}
+    if entry.etag:
+        headers["if-none-match"] = entry.etag
+    if entry.last_modified:
+        headers["if-modified-since"] = entry.last_modified
+    return headers
+
+
+def hit(entry, revalidated=False, filtered=False):
+    entry.hits += 1
+    stats["hits"] += 1
+    if revalidated:
+        stats["revalidated"] += 1
+    if filtered:
+        stats["filtered_hits"] += 1
+
+
+def store_filtered(entry, expr, result):
+    """Keep a JSONPath result computed from a cached body"""
+    if len(result) > MAX_FILTERED or expr in entry.filtered:
+        return
+    if len(entry.filtered) >= MAX_FILTERED_PER_ENTRY:
+        entry.filtered.pop(next(iter(entry.filtered)))
+    entry.filtered[expr] = bytes(result)
+    _evict(False, RAM_BUDGET, None)
+
+
+def _usage(on_flash):
+    if on_flash:
+        return sum(e.size for e in _entries.values() if e.path is not None)
+    return sum(e.ram_bytes() for e in _entries.values())
+
+
+def _evict(on_flash, budget, keep):
+    while _usage(on_flash) > budget:
+        lru = None
+        for k, e in _entries.items():
+            if k != keep and (e.path is not None if on_flash else e.ram_bytes() > 0):
+                if lru is None or time.ticks_diff(_entries[lru].last_used, e.last_used) > 0:
+                    lru = k
+        if lru is None:
+            return
+        _entries.pop(lru).drop()
+        stats["evicted"] += 1
+
+
+def _same_validators(old, new):
+    if old.etag or new.etag:
+        return old.etag == new.etag
+    return old.last_modified is not None and old.last_modified == new.last_modified
+
+
+def invalidate(key):
+    """Drop the entry for key, if any"""
+    entry = _entries.pop(key, None)
+    if entry is not None:
+        entry.drop()
+
+
+class Writer:
+    """
+    Collects a body while it streams to the client, then stores it. failed
+    is set when the body can't be kept, the JSONPath result may still be.
+    """
+
+    def __init__(self, key, entry, size_hint):
+        global _next_file
+        self.key = key
+        self.entry = entry
+        self.size = 0
+        self.file = None
+        self.buf = None
+        self.failed = False
+        self.filtered_expr = None
+        self.filtered = None
+        on_flash = use_flash and (size_hint is None or size_hint > MAX_RAM_ENTRY)
+        self.limit = MAX_FLASH_ENTRY if on_flash else MAX_RAM_ENTRY
+        if size_hint is not None and size_hint > self.limit:
+            self.failed = True
+        elif on_flash:
+            entry.path = f"{CACHE_DIR}/{_next_file}.bin"
+            _next_file += 1
+            try:
+                self.file = open(entry.path, "wb")
+            except OSError:
+                self.failed = True
+        else:
+            self.buf = bytearray()
+
+    def write(self, data):
+        if self.failed:
+            return
+        self.size += len(data)
+        if self.size > self.limit:
+            self.abort()
+        elif self.file is not None:
+            self.file.write(data)
+        else:
+            self.buf.extend(data)
+
+    def tee_filtered(self, expr, downstream):
+        """Wrap the JSONPath output sink so the result is kept too"""
+        self.filtered_expr = expr
+        self.filtered = bytearray()
+
+        def sink(data):
+            if self.filtered is not None:
+                if len(self.filtered) + len(data) > MAX_FILTERED:
+                    self.filtered = None
+                else:
+                    self.filtered.extend(data)
+            downstream(data)
+        return sink
+
+    def abort(self):
+        self.failed = True
+        self.buf = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.entry.drop()
+            self.entry.path = None
+
+    def commit(self, body_complete, filtered_complete):
+        """Store the entry, replacing any older one for the same key"""
+        if not body_complete:
+            self.abort()
+        if not filtered_complete:
+            self.filtered = None
+        if self.failed and self.filtered is None:
+            invalidate(self.key)
+            return
+        if self.file is not None:
+            self.file.close()
+        elif not self.failed:
+            self.entry.body = self.buf
+        if not self.failed:
+            self.entry.size = self.size
+        old = _entries.get(self.key)
+        if old is not None and _same_validators(old, self.entry):
+            # Same representation, so results for other expressions still hold
+            self.entry.filtered.update(old.filtered)
+        if self.filtered is not None:
+            self.entry.filtered[self.filtered_expr] = bytes(self.filtered)
+        while len(self.entry.filtered) > MAX_FILTERED_PER_ENTRY:
+            self.entry.filtered.pop(next(iter(self.entry.filtered)))
+        invalidate(self.key)
+        _entries[self.key] = self.entry
+        stats["stored"] += 1
+        on_flash = self.entry.path is not None
+        if on_flash:
+            _evict(True, FLASH_BUDGET, self.key)
+        _evict(False, RAM_BUDGET, self.key)
+
+
+def enable(flash=False):
+    global enabled, use_flash
+    enabled = True
+    use_flash = flash
+    if flash:
+        try:
+            os.mkdir(CACHE_DIR)
+        except OSError:
+            pass  # Already exists
+
+
+def clear():
+    """Drop every entry and remove any spilled files"""
+    for entry in _entries.values():
+        entry.drop()
+    _entries.clear()
+    for name in stats:
+        stats[name] = 0
+
+
+def disable():
+    global enabled
+    enabled = False
+    clear()
+
+
+def report():
+    """Lines for the CACHE STATS command"""
+    lines = [
+        f"cache={'ON' if enabled else 'OFF'}{' FLASH' if use_flash else ''}",
+        f"entries={len(_entries)} ram={_usage(False)}/{RAM_BUDGET} flash={_usage(True)}/{FLASH_BUDGET}",
+    ]
+    lines.append(" ".join(f"{k}={v}" for k, v in stats.items()))
+    for key, entry in _entries.items():
+        size = f"{entry.size}b" if entry.has_body() else "-"
+        lines.append(f"{key.split(chr(10))[0]} {size} ttl={entry.age()}s hits={entry.hits} filtered={len(entry.filtered)}")
+    return lines
@@ -1,10 +1,17 @@
 # MicroPython imports
-from transport import Transport
+from transport import Transport, AWRITE_CHUNK
 from machine import UART
+import asyncio
+import utime as time
+
+FLOW_CHUNK = 16  # Fewest bytes written at once when flow control is on
+FLOW_SLACK = 64  # Most bytes left in the TX buffer with flow control on, what still goes out after XOFF
 
 class Serial(Transport):
     """UART-based transport implementation."""
 
+    full_duplex = True
+
     def __init__(
         self,
         port,
@@ -52,6 +59,19 @@ class Serial(Transport):
             rxbuf=rxbuf,
             txbuf=txbuf,
         )
+        # Data that arrived while watching for XON/XOFF during a write
+        self.pending = bytearray()
+        self.poll_buf = bytearray(16)
+        # Bytes written under flow control and when, to estimate what is left
+        # in the TX buffer at the baud rate
+        self.queued_at = 0
+        self._set_timing()
+
+    def _set_timing(self):
+        """Time per byte at the line settings, for the flow control estimate"""
+        self.frame_us = (1 + self.bits + (self.parity is not None) + self.stop) * 1000000
+        self.chunk_us = FLOW_CHUNK * self.frame_us // self.baudrate if self.baudrate else 0
+        self.queued = 0
 
     def set_write_mode(self):
         # UART is full-duplex, so no mode switching needed
@@ -67,8 +87,99 @@ class Serial(Transport):
     def read(self, size=1):
         return self.uart.read(size)
 
+    def _poll(self):
+        """Take whatever the client has sent, acting on XON/XOFF and keeping the rest"""
+        while self.uart.any():
+            n = self.uart.readinto(self.poll_buf) or 0
+            if not n:
+                break
+            n = self._filter_flow(self.poll_buf, n)
+            if n:
+                self.pending.extend(self.poll_buf[:n])
+
+    def _queued(self):
+        """Bytes still in the TX buffer from flow controlled writes, estimated"""
+        if not self.queued or self.uart.txdone():
+            return 0
+        sent = time.ticks_diff(time.ticks_us(), self.queued_at) * self.baudrate // self.frame_us
+        return max(0, self.queued - sent)
+
+    def _flow_write(self, view):
+        """
+        Write as much of view as keeps the TX buffer within FLOW_SLACK, so an
+        XOFF stops the output within that many bytes. The buffer is topped up
+        rather than left to drain, so the line doesn't go idle between writes.
+        Returns the bytes written, 0 while paused or short of room.
+        """
+        self._poll()
+        if self.paused:
+            return 0
+        queued = self._queued()
+        room = FLOW_SLACK - queued
+        if room < FLOW_CHUNK and room < len(view):
+            return 0
+        n = self.uart.write(view[:room]) or 0
+        self.queued = queued + n
+        self.queued_at = time.ticks_us()
+        return n
+
+    def write_from(self, buf):
+        view = memoryview(buf)
+        pos = 0
+        if not self.xonxoff:
+            while pos < len(view):
+                # Partial writes continue from a slice of the same buffer
+                pos += self.uart.write(view[pos:] if pos else view) or 0
+            return pos
+
+        while pos < len(view):
+            n = self._flow_write(view[pos:])
+            if not n:
+                if self.paused:
+                    time.sleep_ms(1)
+                else:
+                    time.sleep_us(self.chunk_us)  # Until a chunk's worth has gone out
+            pos += n
+        return pos
+
+    def any(self):
+        return bool(self.pending) or self.uart.any() > 0
+
+    async def awrite(self, buf):
+        view = memoryview(buf)
+        pos = 0
+        while pos < len(view):
+            if not self.xonxoff:
+                pos += self.uart.write(view[pos:pos + AWRITE_CHUNK]) or 0
+                await asyncio.sleep_ms(0)
+                continue
+            # As write_from, but other tasks run while paused or short of room
+            n = self._flow_write(view[pos:])
+            pos += n
+            if n:
+                await asyncio.sleep_ms(0)
+            else:
+                await asyncio.sleep_ms(1 if self.paused else self.chunk_us // 1000)
+        return pos
+
+    def readinto(self, buf):
+        if self.pending:
+            n = min(len(buf), len(self.pending))
+            buf[:n] = self.pending[:n]
+            self.pending = self.pending[n:]
+            return n
+        n = self.uart.readinto(buf) or 0
+        return self._filter_flow(buf, n)
+
     def init(self, **kwargs):
-        return self.uart.init(**kwargs)
+        # The UART takes the settings given, others keep their values
+        self.baudrate = kwargs.get("baudrate", self.baudrate)
+        self.bits = kwargs.get("bits", self.bits)
+        self.parity = kwargs.get("parity", self.parity)
+        self.stop = kwargs.get("stop", self.stop)
+        result = self.uart.init(**kwargs)
+        self._set_timing()
+        return result
 
     def cleanup(self):
         pass
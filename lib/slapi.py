@@ -1,15 +1,32 @@
 # MicroPython imports
 from machine import UART
+from micropython import const
+import asyncio
+import errno
+import select
 import socket
-import ssl
 import sys
-import json
 import time
 
 from transport import Transport
 from config import load_config
-
-DEBUG=False
+import http_pool
+import log
+import dns_cache
+import http_body
+import body_pump
+import http_inflate
+import framing
+import mux
+import paging
+import prefetch
+import response_cache
+import stats
+import wifi
+# ssl, jsonpath and lzss are imported where they are first used, so READY
+# isn't held up loading them
+
+LOGGING = const(1)  # 0 compiles the per-line and per-write logging out
 
 CRLF= "\r\n"
 BIN_CRLF= b"\r\n"
@@ -18,11 +35,38 @@ BIN_DOUBLE_CRLF = b"\r\n\r\n"
 SOH = b'\x01'
 STX = b'\x02'
 EOT = b'\x04'
-XON  = b'\x11'
-XOFF = b'\x13'
+RS  = b'\x1e'        # Ends each item's output in a BATCH
 
-paused = False
 transport = load_config()
+stats.mark("transport")
+
+# Receive buffer shared by every upstream read, allocated once so streaming
+# a body does not churn the heap
+RECV_BUF_SIZE = 1024
+recv_buf = bytearray(RECV_BUF_SIZE)
+recv_view = memoryview(recv_buf)
+
+# Bytes from the client are read in blocks and split into lines in a reused
+# buffer, which only grows for an unusually long line
+RX_BUF_SIZE = 64
+rx_buf = bytearray(RX_BUF_SIZE)
+rx_view = memoryview(rx_buf)
+rx_pos = 0
+rx_len = 0
+line_buf = bytearray(256)
+
+# While a body is pumped, link output is collected here and written by
+# flush_link, which lets the upstream reader run while the link drains
+pump = body_pump.Pump()
+link_muted = False          # Set while a PREFETCH job runs, nothing goes to the client
+link_buffering = False
+link_buf = bytearray(512)
+link_len = 0
+
+IDLE_POLL_MS = 20   # How often the idle loop checks for input from the client
+CONNECT_TIMEOUT_MS = 10000  # Longest a TCP connect to a server may take
+WIFI_WAIT_MS = 20000    # How long a request waits for Wi-Fi to connect after boot
+wifi_task = None        # Joins Wi-Fi after READY, see serve
 
 
 # ------------------------
@@ -34,160 +78,145 @@ state = {
     "send_headers": True,
     "flow": "OFF",
     "default_headers": {},
-    "jsonpath": None,
+    "jsonpath": None,       # Compiled steps of jsonpath_expr
+    "jsonpath_expr": None,
     "use_ssl": None,  # None=auto-detect, True=force HTTPS, False=force HTTP
+    "compress": None,       # Body encoding on the link, None or "LZSS"
+    "mux": False,           # Framed channels on the link, see mux.py
+    "framing": "SENTINEL",  # Response delimiting, "SENTINEL" (SOH/STX/EOT) or "LENGTH"
+    "window": None,         # (offset, length) of each body sent, see paging.py
 }
+LINK_SETTINGS = ("flow", "mux")     # Settings of the whole link rather than a MUX channel
+
+def channel_state():
+    """A copy of state for a new MUX channel, which the channel's commands then change"""
+    settings = {k: v for k, v in state.items() if k not in LINK_SETTINGS}
+    settings["default_headers"] = state["default_headers"].copy()
+    return settings
+
+def current_state():
+    """The settings the running task works with, its MUX channel's or the link's"""
+    channel = mux.current()
+    return channel.state if channel is not None else state
+
+# Body bytes before and after link compression, for the COMPRESS command
+compress_stats = {"last_raw": 0, "last_sent": 0, "raw": 0, "sent": 0}
+body_encoder = None     # lzss.Encoder or framing.Framer of the body being sent
 
 # ------------------------
 # Utility
 # ------------------------
 
-lastchar = None
 def debug_write(data):
-    global lastchar
-    # For debugging purposes, write to stderr
-    # Convert \r to \n for proper display
-    # if data == b'\r':
-    #     data = b'\n'
-    if (lastchar == b'\r' and data != b'\n'):
-        sys.stderr.write('\n')
-    sys.stderr.buffer.write(data)
-    lastchar = data
+    """Log the progress of a request, at log.DEBUG"""
+    if LOGGING and log.level >= log.DEBUG:
+        log.write(data)
 
 def transport_write(data):
-    global paused
-    if state["flow"] == "X":
-        while paused:
-            pass
-    written = 0
-    length = len(data)
-    while written < length:
-        if DEBUG:
-            debug_write(data[written:])  # Log chunks of data being written to transport
-        written += transport.write(data[written:]) or 0
+    # With FLOW X the transport holds the output while the client has sent XOFF
+    global link_len
+    if link_muted:
+        return
+    if LOGGING and log.level >= log.TRACE:
+        log.write(data)  # Log data being written to transport
+    stats.count("link_out", len(data))
+    channel = mux.current()
+    if channel is not None:
+        channel.collect(data)
+        return
+    if link_buffering:
+        end = link_len + len(data)
+        if end > len(link_buf):
+            link_buf.extend(bytes(end - len(link_buf)))
+        link_buf[link_len:end] = data
+        link_len = end
+        return
+    started = time.ticks_us()
+    transport.write_from(data)
+    stats.record("link_write", started)
+
+async def flush_link():
+    """Write the output collected while pumping a body"""
+    global link_len
+    # Send a partly gathered frame now, rather than hold a streamed body back
+    encoder = current_body_encoder()
+    if encoder is not None:
+        encoder.flush()
+    channel = mux.current()
+    if channel is not None:
+        await channel.flush(mux_write)
+        return
+    if link_len:
+        n, link_len = link_len, 0
+        started = time.ticks_us()
+        await transport.awrite(memoryview(link_buf)[:n])
+        stats.record("link_write", started)
+
+def log_line(line):
+    """Echo a received line to the console, hiding secret header values"""
+    log.write(log.redact(line))
+    log.write(BIN_CRLF)
 
 def readline():
-    hide = False
-    buf = b""
+    global rx_pos, rx_len, line_buf
+    n = 0
     while True:
-        b = transport.read(1)
-        if not b:
+        if rx_pos == rx_len:
+            rx_pos = 0
+            started = time.ticks_us()
+            rx_len = transport.readinto(rx_view)
+            if rx_len:
+                stats.record("link_read", started)
+                stats.count("link_in", rx_len)
             continue
-        if buf == b"HEADERS Authorization Bearer ":
-            hide = True
-
-        if hide and not (b in (b"\r", b"\n")):
-            debug_write(b"*")  # Log hidden characters as asterisks
-        else:
-            debug_write(b)  # Log characters being read from transport
-        
-        if state["flow"] == "X":
-            global paused
-            if b == XOFF:
-                paused = True
-                continue
-            if b == XON:
-                paused = False
-                continue
-        buf += b
-        if buf.endswith(b"\r\n"):
-            return buf.decode().rstrip(CRLF)
+        b = rx_buf[rx_pos]
+        rx_pos += 1
+        if n == len(line_buf):
+            line_buf.extend(bytes(n))
+        line_buf[n] = b
+        n += 1
+        if b == 0x0A and n > 1 and line_buf[n - 2] == 0x0D:
+            line = memoryview(line_buf)[:n - 2]
+            if LOGGING and log.level >= log.INFO:
+                log_line(line)
+            return str(line, "utf-8").rstrip(CRLF)
 
 
 def error(status, msg):
     """HTTP error response"""
-    print(f"HTTP/1.1 {status}{DOUBLE_CRLF}{msg}")
+    if log.level >= log.ERROR:
+        print(f"HTTP/1.1 {status}{DOUBLE_CRLF}{msg}")
     transport_write(f"HTTP/1.1 {status}{DOUBLE_CRLF}{msg}{CRLF}".encode())
 
 def slapi_error(code, msg):
     """SLAPI protocol error response"""
-    print(f"SLAPI/1.0 {code} {msg}", file=sys.stderr)
+    if log.level >= log.ERROR:
+        print(f"SLAPI/1.0 {code} {msg}", file=sys.stderr)
     transport_write(f"SLAPI/1.0 {code} {msg}{CRLF}".encode())
 
-def ok():
-    print("OK", file=sys.stderr)
-    transport_write(f"OK{CRLF}".encode())
-
-def apply_jsonpath(data, path):
+def request_error(turn, code, msg):
     """
-    Apply a JSONPath-like expression to filter JSON data.
-    Supports: $.key, $.key.subkey, $.array[0], $.array[*], $.key[*].subkey
+    slapi_error for send_http. A batched request that hasn't reached its
+    turn keeps the error, it is sent when the responses before it are done.
     """
-    if not path or not path.startswith("$"):
-        return None
-
-    parts = []
-    current = ""
-    i = 1  # Skip the leading $
-
-    while i < len(path):
-        ch = path[i]
-        if ch == ".":
-            if current:
-                parts.append(current)
-                current = ""
-        elif ch == "[":
-            if current:
-                parts.append(current)
-                current = ""
-            # Find closing bracket
-            j = i + 1
-            while j < len(path) and path[j] != "]":
-                j += 1
-            bracket_content = path[i+1:j]
-            parts.append(f"[{bracket_content}]")
-            i = j
-        else:
-            current += ch
-        i += 1
-
-    if current:
-        parts.append(current)
-
-    result = data
-    for part in parts:
-        if part.startswith("[") and part.endswith("]"):
-            index = part[1:-1]
-            if index == "*":
-                # Wildcard - keep as list for further processing
-                if isinstance(result, list):
-                    # Already a list, continue
-                    pass
-                elif isinstance(result, dict):
-                    result = list(result.values())
-                else:
-                    return None
-            else:
-                # Numeric index
-                try:
-                    if isinstance(result, list):
-                        result = result[int(index)]
-                    else:
-                        return None
-                except (IndexError, ValueError):
-                    return None
-        else:
-            if isinstance(result, list):
-                # Apply to each element in list
-                new_result = []
-                for item in result:
-                    if isinstance(item, dict) and part in item:
-                        new_result.append(item[part])
-                result = new_result if new_result else None
-            elif isinstance(result, dict):
-                result = result.get(part)
-            else:
-                return None
+    if turn is not None and not turn.go.is_set():
+        if log.level >= log.ERROR:
+            print(f"SLAPI/1.0 {code} {msg}", file=sys.stderr)
+        turn.error = (code, msg)
+        return
+    slapi_error(code, msg)
 
-        if result is None:
-            return None
+def ok():
+    if log.level >= log.INFO:
+        print("OK", file=sys.stderr)
+    transport_write(f"OK{CRLF}".encode())
 
-    return result
 # ------------------------
 # Command Handling
 # ------------------------
 
 def handle_command(line):
+    settings = current_state()  # A command on a MUX channel changes that channel's
     parts = line.split(" ", 1)
     cmd = parts[0]
 
@@ -195,7 +224,7 @@ def handle_command(line):
         if len(parts) < 2:
             slapi_error("400", "DOMAIN requires an argument")
             return
-        state["domain"] = parts[1].strip()
+        settings["domain"] = parts[1].strip()
         ok()
 
     elif cmd == "RESPONSE":
@@ -205,23 +234,61 @@ def handle_command(line):
         args = parts[1].split(" ", 1)
         subcmd = args[0].strip()
         if subcmd == "HDRS_ON":
-            state["send_headers"] = True
+            settings["send_headers"] = True
             ok()
         elif subcmd == "HDRS_OFF":
-            state["send_headers"] = False
+            settings["send_headers"] = False
+            ok()
+        elif subcmd == "FRAMING":
+            mode = args[1].strip() if len(args) > 1 else ""
+            if mode not in ("SENTINEL", "LENGTH"):
+                slapi_error("400", "RESPONSE FRAMING must be SENTINEL or LENGTH")
+                return
+            settings["framing"] = mode
+            ok()
+        elif subcmd == "WINDOW":
+            arg = args[1].strip() if len(args) > 1 else ""
+            if arg == "OFF":
+                settings["window"] = None
+                paging.clear()
+                ok()
+                return
+            try:
+                offset, length = [int(n) for n in arg.split(",")]
+            except ValueError:
+                slapi_error("400", "RESPONSE WINDOW requires offset,length or OFF")
+                return
+            if offset < 0 or length <= 0:
+                slapi_error("400", "RESPONSE WINDOW requires offset,length or OFF")
+                return
+            settings["window"] = (offset, length)
             ok()
         elif subcmd == "JSONPATH":
             if len(args) == 1:
                 # Clear the jsonpath
-                state["jsonpath"] = None
+                settings["jsonpath"] = None
+                settings["jsonpath_expr"] = None
             else:
-                state["jsonpath"] = args[1].strip()
+                # Compile once here so every response just runs the steps
+                expr = args[1].strip()
+                import jsonpath
+                try:
+                    settings["jsonpath"] = jsonpath.compile(expr)
+                except ValueError as e:
+                    slapi_error("400", str(e))
+                    return
+                settings["jsonpath_expr"] = expr
             ok()
         else:
             slapi_error("400", "Unknown RESPONSE subcommand")
 
     elif cmd == "FLOW":
+        # Both ends of the link would have to change their stuffing at once
+        if state["mux"]:
+            slapi_error("400", "FLOW can't change while MUX is on")
+            return
         state["flow"] = parts[1].strip()
+        transport.set_flow(state["flow"] == "X")
         ok()
 
     elif cmd == "SERIAL":
@@ -243,30 +310,151 @@ def handle_command(line):
     elif cmd == "HEADERS":
         if len(parts) == 1:
             # List all headers
-            if state["default_headers"]:
-                for k, v in state["default_headers"].items():
+            if settings["default_headers"]:
+                for k, v in settings["default_headers"].items():
                     transport_write(f"{k}: {v}{CRLF}".encode())
             else:
                 transport_write(f"(no default headers){CRLF}".encode())
         else:
             args = parts[1].split(" ", 1)
             if args[0] == "CLEAR":
-                state["default_headers"].clear()
+                settings["default_headers"].clear()
                 ok()
             elif len(args) >= 2:
                 header_name = args[0].strip()
                 header_value = args[1].strip()
-                state["default_headers"][header_name.lower()] = header_value
+                settings["default_headers"][header_name.lower()] = header_value
                 ok()
             else:
                 slapi_error("400", "HEADERS requires header name and value")
 
+    elif cmd == "DNS":
+        if len(parts) == 1:
+            # List cached lookups
+            for host, port, addr, ttl in dns_cache.entries():
+                result = addr[0] if addr else "FAILED"
+                transport_write(f"{host}:{port} {result} {ttl}s{CRLF}".encode())
+            transport_write(f"hits={dns_cache.hits} misses={dns_cache.misses}{CRLF}".encode())
+        elif parts[1].strip() == "FLUSH":
+            dns_cache.flush()
+            ok()
+        else:
+            slapi_error("400", "Unknown DNS subcommand")
+
+    elif cmd == "CACHE":
+        sub = parts[1].strip() if len(parts) > 1 else "STATS"
+        if sub == "ON":
+            response_cache.enable()
+            ok()
+        elif sub == "FLASH":
+            response_cache.enable(flash=True)
+            ok()
+        elif sub == "OFF":
+            response_cache.disable()
+            ok()
+        elif sub == "CLEAR":
+            response_cache.clear()
+            ok()
+        elif sub == "STATS":
+            for line in response_cache.report():
+                transport_write(f"{line}{CRLF}".encode())
+        else:
+            slapi_error("400", "Unknown CACHE subcommand")
+
+    elif cmd == "COMPRESS":
+        sub = parts[1].strip() if len(parts) > 1 else ""
+        if sub == "LZSS":
+            settings["compress"] = "LZSS"
+            ok()
+        elif sub == "OFF":
+            settings["compress"] = None
+            ok()
+        elif sub == "":
+            # Report the mode and the ratio achieved
+            last_raw, last_sent = compress_stats["last_raw"], compress_stats["last_sent"]
+            raw, sent = compress_stats["raw"], compress_stats["sent"]
+            transport_write(f"compress={settings['compress'] or 'OFF'}{CRLF}".encode())
+            transport_write(f"last={last_raw}/{last_sent} ratio={ratio(last_raw, last_sent)}{CRLF}".encode())
+            transport_write(f"total={raw}/{sent} ratio={ratio(raw, sent)}{CRLF}".encode())
+        else:
+            slapi_error("400", "Unsupported compression")
+
+    elif cmd == "PREFETCH":
+        if len(parts) == 1:
+            for line in prefetch.report(response_cache.peek):
+                transport_write(f"{line}{CRLF}".encode())
+            return
+        args = parts[1].strip().split(" ", 1)
+        if args[0] == "CLEAR":
+            prefetch.clear()
+            ok()
+            return
+        try:
+            interval = int(args[0])
+        except ValueError:
+            slapi_error("400", "PREFETCH requires an interval and a path")
+            return
+        if len(args) < 2 or not args[1].strip().startswith("/"):
+            slapi_error("400", "PREFETCH requires an interval and a path")
+            return
+        path = args[1].strip()
+        if interval == 0:
+            prefetch.remove(settings["domain"], path, settings["jsonpath_expr"])
+            ok()
+        elif not response_cache.enabled:
+            slapi_error("400", "PREFETCH requires CACHE ON")
+        elif not settings["domain"]:
+            slapi_error("400", "PREFETCH requires DOMAIN")
+        elif interval < prefetch.MIN_INTERVAL:
+            slapi_error("400", f"PREFETCH interval must be at least {prefetch.MIN_INTERVAL}s")
+        elif not prefetch.add(settings["domain"], path, settings["jsonpath"], settings["jsonpath_expr"],
+                              settings["use_ssl"], settings["default_headers"], interval):
+            slapi_error("400", "Too many PREFETCH jobs")
+        else:
+            ok()
+
+    elif cmd == "MUX":
+        sub = parts[1].strip() if len(parts) > 1 else ""
+        if sub == "ON":
+            if not transport.full_duplex:
+                slapi_error("400", "MUX needs a full duplex link")
+                return
+            state["mux"] = True
+            ok()
+        elif sub == "OFF":
+            state["mux"] = False
+            ok()
+        else:
+            slapi_error("400", "Unknown MUX subcommand")
+
+    elif cmd == "STATS":
+        sub = parts[1].strip() if len(parts) > 1 else ""
+        if sub == "":
+            for line in stats.report():
+                transport_write(f"{line}{CRLF}".encode())
+        elif sub == "RESET":
+            stats.reset()
+            ok()
+        elif sub in ("LOG ON", "LOG OFF"):
+            stats.set_log(sub == "LOG ON")
+            ok()
+        else:
+            slapi_error("400", "Unknown STATS subcommand")
+
+    elif cmd == "DEBUG":
+        if len(parts) == 1:
+            transport_write(f"debug={log.level_name()}{CRLF}".encode())
+        elif log.set_level(parts[1].strip()):
+            ok()
+        else:
+            slapi_error("400", "DEBUG must be OFF, ERROR, INFO, ON, DEBUG or TRACE")
+
     elif cmd == "HTTPS":
-        state["use_ssl"] = True
+        settings["use_ssl"] = True
         ok()
 
     elif cmd == "HTTP":
-        state["use_ssl"] = False
+        settings["use_ssl"] = False
         ok()
 
     else:
@@ -277,7 +465,7 @@ def handle_command(line):
 # HTTP Handling
 # ------------------------
 
-def read_http_request(first_line, method):
+def read_http_request(first_line, method, read=readline):
     headers = {}
     body = b""
 
@@ -285,7 +473,7 @@ def read_http_request(first_line, method):
 
     # Read headers until blank line
     while True:
-        line = readline()
+        line = read()
         if line == "":
             # Blank line separates headers from body
             break
@@ -309,7 +497,7 @@ def read_http_request(first_line, method):
     if method in ("POST", "PUT", "PATCH"):
         # Read body until blank line
         while True:
-            line = readline()
+            line = read()
             if line == "":
                 # Blank line ends body
                 break
@@ -318,117 +506,328 @@ def read_http_request(first_line, method):
         if body_lines:
             body = (CRLF.join(body_lines) + DOUBLE_CRLF)
     else:
-        debug_write(b"--- No Body Expected for Method " + method.encode() + b" ---\r\n")
+        if log.level >= log.DEBUG:
+            debug_write(b"--- No Body Expected for Method " + method.encode() + b" ---\r\n")
 
     debug_write(b"--- HTTP Request Read ---\r\n")
     return headers, body
 
-def recv_until(sock, marker):
+async def recv_status(sock):
+    """
+    As recv_until(sock, BIN_CRLF), yielding to other tasks while the
+    server prepares its response.
+    """
+    buf = bytearray(256)
     data = b""
+    sock.setblocking(False)
+    try:
+        stream = asyncio.StreamReader(sock)
+        while BIN_CRLF not in data:
+            n = await stream.readinto(buf)
+            if n is None:
+                continue
+            if not n:
+                raise OSError("Connection closed by server")
+            data += buf[:n]
+    finally:
+        sock.setblocking(True)
+    return data
+
+def recv_until(sock, marker, data=b""):
     while marker not in data:
-        data += sock.recv(4096)
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise OSError("Connection closed by server")
+        data += chunk
     return data
 
-def send_http(method, path, headers, body, redirected_host=None, _redirects=0, _max_redirects=5):
+def read_body(sock, data, decoder, consumer=None):
+    """
+    Feed a response body through its framing decoder as it arrives.
+    data is the part already received with the headers. Reading stops early
+    once consumer.done is set. Returns True if the whole body was read.
+    """
+    if data:
+        decoder.feed(data)
+    while not decoder.done:
+        if consumer is not None and consumer.done:
+            return False
+        n = sock.readinto(recv_view)
+        if not n:
+            return decoder.eof()
+        stats.count("upstream_in", n)
+        decoder.feed(recv_view[:n])
+    return True
+
+async def pump_body(sock, data, decoder, consumer=None):
+    """
+    As read_body, with the socket read by its own task so the download
+    overlaps writing the link. Returns True if the whole body was read.
+    """
+    global link_buffering
+    channel = mux.current()
+    link_buffering = channel is None
+    try:
+        return await (channel.pump if channel else pump).run(sock, data, decoder, consumer, flush_link)
+    finally:
+        link_buffering = False
+        await flush_link()
+
+def discard(data):
+    pass
+
+async def connect(sock, addr):
+    """sock.connect without blocking, other tasks run until the server answers"""
+    sock.setblocking(False)
+    try:
+        sock.connect(addr)
+    except OSError as e:
+        if e.errno != errno.EINPROGRESS:
+            raise
+    poller = select.poll()
+    poller.register(sock, select.POLLOUT)
+    deadline = time.ticks_add(time.ticks_ms(), CONNECT_TIMEOUT_MS)
+    while True:
+        events = poller.poll(0)
+        if events:
+            if events[0][1] & (select.POLLERR | select.POLLHUP):
+                raise OSError(errno.ECONNREFUSED)
+            return
+        if time.ticks_diff(deadline, time.ticks_ms()) <= 0:
+            raise OSError(errno.ETIMEDOUT)
+        await asyncio.sleep_ms(1)
+
+async def send_all(sock, data):
+    """
+    Write all of data to a non-blocking socket, letting other tasks run while
+    it can take no more. A new TLS connection makes its handshake here.
+    """
+    view = memoryview(data)
+    pos = 0
+    while pos < len(view):
+        n = sock.write(view[pos:])
+        if n is None:
+            await asyncio.sleep_ms(1)
+        else:
+            pos += n
+
+async def open_connection(host, port, use_ssl, turn=None):
+    """
+    Connect to host, reporting failures to the client. Returns None on error.
+    A TLS socket is returned before its handshake, which send_all makes.
+    """
+    started = time.ticks_us()
+    try:
+        # A lookup that misses the cache blocks, lwIP has no other way
+        addr = dns_cache.resolve(host, port)
+    except OSError as e:
+        request_error(turn, "500", f"DNS resolution failed for {host}: {e}")
+        return None
+    started = stats.record("dns", started)
+    
+    s = socket.socket()
+    
+    try:
+        await connect(s, addr)
+    except OSError as e:
+        request_error(turn, "500", f"Connection failed to {host}:{port}: {e}")
+        s.close()
+        return None
+    stats.record("connect", started)
+    
+    # Wrap with SSL if HTTPS
+    if use_ssl:
+        import ssl
+        s = ssl.wrap_socket(s, server_hostname=host, do_handshake=False)
+    return s
+
+def release_connection(key, sock, reusable):
+    """Keep a fully read connection for the next request, or close it"""
+    if reusable:
+        debug_write(b"--- Connection Kept Alive ---\r\n")
+        http_pool.put(key, sock)
+    else:
+        sock.close()
+
+async def send_http(method, path, headers, body, redirected_host=None, _redirects=0, _max_redirects=5, job=None, turn=None, window=None):
+    settings = current_state()
     # Merge default headers (request headers override defaults)
-    merged_headers = state["default_headers"].copy()
+    merged_headers = settings["default_headers"].copy()
     merged_headers.update(headers)
     req_headers = merged_headers
     
     host = redirected_host or headers.get("host")
 
     if not host:
-        if not state["domain"]:
-            slapi_error("400", "DOMAIN not set and no Host header provided")
+        if not settings["domain"]:
+            request_error(turn, "400", "DOMAIN not set and no Host header provided")
             return
-        host = state["domain"]
+        host = settings["domain"]
         req_headers["host"] = host
 
     # Detect protocol and port
     use_ssl = False
-    port = 80
+    port = None
     
     if host.startswith("https://"):
         use_ssl = True
-        port = 443
         host = host[8:]  # Remove https://
     elif host.startswith("http://"):
         host = host[7:]  # Remove http://
     
     # Override with state setting if specified
-    if state["use_ssl"] is not None:
-        use_ssl = state["use_ssl"]
-        port = 443 if use_ssl else 80
+    if settings["use_ssl"] is not None:
+        use_ssl = settings["use_ssl"]
     
-    # Remove trailing slash if present
-    if host.endswith("/"):
-        host = host[:-1]
+    # Split off any path, redirect locations are full URLs
+    slash = host.find("/")
+    host_path = "/"
+    if slash >= 0:
+        host, host_path = host[:slash], host[slash:]
+    if redirected_host:
+        path = host_path
+
+    # Explicit port, e.g. DOMAIN http://192.168.1.10:8080
+    if ":" in host:
+        host, port_str = host.rsplit(":", 1)
+        port = int(port_str)
+    if port is None:
+        port = 443 if use_ssl else 80
     
     # Update the host header with port for non-default ports or when HTTPS
-    if use_ssl:
-        req_headers["host"] = f"{host}:443"
-    elif port != 80:
+    if use_ssl or port != 80:
         req_headers["host"] = f"{host}:{port}"
     else:
         req_headers["host"] = host
 
-    try:
-        addr = socket.getaddrinfo(host, port)[0][-1]
-    except OSError as e:
-        slapi_error("500", f"DNS resolution failed for {host}: {e}")
-        return
-    
-    s = socket.socket()
-    
-    try:
-        s.connect(addr)
-    except OSError as e:
-        slapi_error("500", f"Connection failed to {host}:{port}: {e}")
-        s.close()
-        return
-    
-    # Wrap with SSL if HTTPS
-    if use_ssl:
-        s = ssl.wrap_socket(s, server_hostname=host)
-
-    # Add Content-Length header if body is present
-    if body:
-        req_headers["content-length"] = str(len(body))
-
+    # Serve from the response cache, or revalidate a stale entry
+    cache_key = None
+    cached = None
+    validators = {}
+    conditional = "if-none-match" in req_headers or "if-modified-since" in req_headers
+    if response_cache.enabled and method == "GET" and not conditional:
+        cache_key = response_cache.make_key(method, host, port, path, req_headers)
+        cached = response_cache.lookup(cache_key)
+        if cached is not None and not cache_can_serve(cached):
+            cached = None  # Only other JSONPath results are kept for this URL
+        if job is not None:
+            job.key = cache_key
+        if cached is not None:
+            # A PREFETCH job always goes to the server
+            if cached.fresh() and job is None:
+                debug_write(b"--- Cache Hit ---\r\n")
+                prefetch.count_hit(cache_key)
+                if turn is not None:
+                    await turn.wait()
+                send_cached(cached, window=window)
+                return
+            debug_write(b"--- Cache Stale, Revalidating ---\r\n")
+            validators = response_cache.conditional_headers(cached)
+
+    # Ask for just the window when nothing needs the whole body: not the cache,
+    # not a JSONPath filter. A server without range support sends it all
+    ranged = (window is not None and method == "GET" and cache_key is None
+              and settings["jsonpath"] is None and "range" not in req_headers)
+
+    # Ask for a compressed body, the proxy inflates it before the client sees it.
+    # A client that sends its own Accept-Encoding gets the body as the server sends it.
+    # Ranges are of the compressed bytes, so a ranged request asks for a plain body
+    inflate = "accept-encoding" not in req_headers and http_inflate.available() and not ranged
+
+    # Headers the proxy adds go in the request only, not req_headers, which a
+    # redirect passes on. The next hop decides them again. Content-Length is
+    # always the proxy's, the client's body ends at a blank line
     req = f"{method} {path} HTTP/1.1{CRLF}"
     for k, v in req_headers.items():
+        if k != "content-length":
+            req += f"{k}: {v}{CRLF}"
+    for k, v in validators.items():
         req += f"{k}: {v}{CRLF}"
+    if inflate:
+        req += f"accept-encoding: {http_inflate.ACCEPT_ENCODING}{CRLF}"
+    if body:
+        req += f"content-length: {len(body)}{CRLF}"
+    if ranged:
+        req += f"range: {window.range_header()}{CRLF}"
     req += CRLF
 
-    debug_write(b"\r\n--- Sending Request ---\r\n")
-    # debug_write(req.encode())             don't show potentially sensitive headers in debug log
-    s.send(req.encode())
-    if body:
-        debug_write(b"\r\n--- Sending Body ---\r\n")
-        debug_write(body)
-        s.send(body)
+    # Reuse a kept-alive connection to the same host when we have one
+    key = (host, port, use_ssl)
+    keep_alive = req_headers.get("connection", "").lower() != "close"
+    s = http_pool.get(key) if keep_alive else None
+    reused = s is not None
+    if reused:
+        debug_write(b"--- Reusing Pooled Connection ---\r\n")
+    else:
+        # Wi-Fi is still associating for requests sent straight after READY
+        if not await wifi.wait_connected(WIFI_WAIT_MS):
+            request_error(turn, "500", "Wi-Fi not connected")
+            return
+        s = await open_connection(host, port, use_ssl, turn)
+        if s is None:
+            return
+
+    while True:
+        try:
+            debug_write(b"\r\n--- Sending Request ---\r\n")
+            # debug_write(req.encode())             don't show potentially sensitive headers in debug log
+            started = time.ticks_us()
+            s.setblocking(False)
+            await send_all(s, req.encode())
+            if use_ssl and not reused:
+                started = stats.record("tls", started)
+                stats.sample_heap()  # The handshake buffers are the largest a request holds
+            if body:
+                debug_write(b"\r\n--- Sending Body ---\r\n")
+                if LOGGING and log.level >= log.TRACE:
+                    log.write(body)
+                await send_all(s, body)
+            first_headers = await recv_status(s)
+            stats.record("wait", started)
+            break
+        except OSError as e:
+            s.close()
+            if not reused:
+                request_error(turn, "500", f"Connection failed to {host}:{port}: {e}")
+                return
+            # The server dropped the idle connection, retry once on a fresh one
+            debug_write(b"--- Stale Pooled Connection, Reconnecting ---\r\n")
+            s = await open_connection(host, port, use_ssl, turn)
+            if s is None:
+                return
+            reused = False
 
     # Read headers
-    first_headers = recv_until(s, BIN_CRLF)
     status_line, raw_headers = first_headers.split(BIN_CRLF, 1)
     debug_write(b"--- Status Received ---\r\n")
-    debug_write(status_line + b"\r\n")
-    transport_write(status_line + BIN_CRLF)
+    if log.level >= log.DEBUG:
+        debug_write(status_line + b"\r\n")
 
     debug_write(b"--- Receiving Headers ---\r\n")
-    if BIN_DOUBLE_CRLF not in raw_headers:
-        raw_headers += recv_until(s, BIN_DOUBLE_CRLF)
+    if BIN_DOUBLE_CRLF not in BIN_CRLF + raw_headers:
+        raw_headers = recv_until(s, BIN_DOUBLE_CRLF, raw_headers)
+    # Status line, headers and the start of the body, the pump counts the rest
+    stats.count("upstream_in", len(status_line) + 2 + len(raw_headers))
 
-    resp_headers, body = raw_headers.split(BIN_DOUBLE_CRLF, 1)
-    bodyLen = len(body)
+    if raw_headers.startswith(BIN_CRLF):
+        resp_headers, resp_body = b"", raw_headers[2:]  # No headers at all
+    else:
+        resp_headers, resp_body = raw_headers.split(BIN_DOUBLE_CRLF, 1)
 
-    debug_write(resp_headers + b"\r\n")
+    if log.level >= log.DEBUG:
+        debug_write(log.redact_lines(resp_headers) + b"\r\n")
     
     debug_write(b"--- Headers Received ---\r\n")
-    remainingLength = 0
+    content_length = None
+    chunked = False
     content_type = None
     location = None
+    content_range = None
     status_code = None
+    content_encoding = None
+    forward_headers = []
+    # HTTP/1.1 connections stay open unless the server says otherwise
+    keep_alive = keep_alive and status_line.startswith(b"HTTP/1.1")
 
     # Parse Headers for Content-Length and Content-Type, Location, and Status Code
     try:
@@ -436,109 +835,681 @@ def send_http(method, path, headers, body, redirected_host=None, _redirects=0, _
     except Exception:
         status_code = None
 
-    debug_write(b"--- Status Code: " + (str(status_code).encode() if status_code else b"Unknown") + b" ---\r\n")
+    if log.level >= log.DEBUG:
+        debug_write(b"--- Status Code: " + (str(status_code).encode() if status_code else b"Unknown") + b" ---\r\n")
 
     for line in resp_headers.split(BIN_CRLF):
         line_lower = line.lower()
+        if line_lower.startswith(b"transfer-encoding"):
+            # The body is decoded before it reaches the client
+            chunked = b"chunked" in line_lower
+            continue
+        if line_lower.startswith(b"content-encoding"):
+            encoding = line_lower.split(b":", 1)[1].strip().decode()
+            if inflate and encoding in http_inflate.ENCODINGS:
+                # The client receives the decoded body
+                content_encoding = encoding
+                continue
         if line_lower.startswith(b"content-length"):
-            remainingLength = int(line.split(b":")[1].strip()) - bodyLen
+            content_length = int(line.split(b":")[1].strip())
         elif line_lower.startswith(b"content-type"):
             content_type = line.split(b":")[1].strip().decode()
         elif line_lower.startswith(b"location"):
             location = line.split(b":", 1)[1].strip().decode()
+        elif line_lower.startswith(b"content-range"):
+            content_range = line.split(b":", 1)[1].strip().decode()
+        elif line_lower.startswith(b"connection") and b"close" in line_lower:
+            keep_alive = False
+        forward_headers.append(line)
+    if content_encoding:
+        # Content-Length is the compressed size, the decoded one isn't known up front
+        forward_headers = [line for line in forward_headers if not line.lower().startswith(b"content-length")]
+
+    # Responses that never carry a body, whatever the headers say
+    if method == "HEAD" or status_code in (204, 304) or (status_code or 200) < 200:
+        body_decoder = http_body.LengthBody
+        content_length = 0
+    elif chunked:
+        # Transfer-Encoding overrides Content-Length
+        body_decoder = http_body.ChunkedBody
+        content_length = None
+    elif content_length is not None:
+        body_decoder = http_body.LengthBody
+    else:
+        # Body is delimited by the server closing the connection
+        body_decoder = http_body.CloseBody
+        keep_alive = False
+
+    def decoder(sink):
+        if body_decoder is http_body.LengthBody:
+            return http_body.LengthBody(content_length, sink)
+        return body_decoder(sink)
 
     # Follow redirects (3xx + Location)
     if status_code in (301, 302, 303, 307, 308) and location:
+        # Discard the redirect body so the connection can be reused
+        complete = False
+        if keep_alive:
+            try:
+                complete = read_body(s, resp_body, decoder(discard))
+            except (OSError, ValueError):
+                pass
+        release_connection(key, s, keep_alive and complete)
+
         if _redirects >= _max_redirects:
-            slapi_error("500", "Too many redirects")
+            request_error(turn, "500", "Too many redirects")
             return
         
+        # Relative locations stay on the same server
+        if location.startswith("/"):
+            location = f"{'https' if use_ssl else 'http'}://{host}:{port}{location}"
+
         # Per RFC, switch to GET on 303
         new_method = "GET" if status_code == 303 else method
         debug_write(f"\r\n--- Redirecting to {location} (status {status_code}) ---\r\n".encode())
-        return send_http(new_method, path, req_headers, body if new_method != "GET" else b"", location, _redirects + 1, _max_redirects)
+        return await send_http(new_method, path, req_headers, body if new_method != "GET" else b"", location, _redirects + 1, _max_redirects, job, turn, window)
+
+    # Prefetched copies stay fresh until well after the next refresh
+    min_age = job.lifetime() if job is not None else 0
+
+    # Everything from here on goes to the client
+    if turn is not None:
+        await turn.wait()
+
+    # Not modified, answer from the cache
+    if status_code == 304 and validators:
+        release_connection(key, s, keep_alive and read_body(s, resp_body, decoder(discard)))
+        _, max_age, etag, last_modified = response_cache.parse_policy(forward_headers, min_age)
+        cached.refresh(max_age)
+        cached.etag = etag or cached.etag
+        cached.last_modified = last_modified or cached.last_modified
+        debug_write(b"--- Cache Revalidated ---\r\n")
+        if job is None:
+            send_cached(cached, revalidated=True, window=window)
+        return
+
+    # Keep a copy of cacheable responses, and their JSONPath result, as they stream past
+    writer = None
+    if cache_key is not None:
+        storable, max_age, etag, last_modified = response_cache.parse_policy(forward_headers, min_age)
+        if status_code == 200 and storable:
+            entry = response_cache.Entry(status_line, forward_headers, content_type, etag, last_modified, max_age)
+            writer = response_cache.Writer(cache_key, entry, None if content_encoding else content_length)
+        elif job is None:
+            # A failed refresh keeps the last good copy
+            response_cache.invalidate(cache_key)
+
+    # Only successful bodies are paged, an error is sent whole
+    page = window if status_code in (200, 206) else None
+    if page is not None:
+        page.begin(status_line, forward_headers, content_range if ranged and status_code == 206 else None)
+
+    send_head(status_line, forward_headers)
+    sink, evaluator = start_body(content_type, page)
+    if writer is not None:
+        if evaluator is not None:
+            evaluator.sink = writer.tee_filtered(settings["jsonpath_expr"], evaluator.sink)
+        if not writer.failed:
+            downstream = sink
+
+            def sink(data):
+                writer.write(data)
+                downstream(data)
+
+    inflater = None
+    if content_encoding and content_length != 0:
+        inflater = http_inflate.Inflater(content_encoding, sink)
+        sink = inflater.feed
 
-    if state["send_headers"]:
+    try:
+        # A cached body must be read in full, otherwise stop once the JSONPath
+        # result is complete, or the window is sent and the rest isn't kept
+        keep_body = writer is not None and not writer.failed
+        started = time.ticks_us()
+        complete = await pump_body(s, resp_body, decoder(sink), None if keep_body else page or evaluator)
+        stats.record("download", started)
+        stats.sample_heap()
+        if complete and inflater is not None:
+            inflater.finish()
+    except ValueError as e:
+        debug_write(f"\r\n--- Body Error: {e} ---\r\n".encode())
+        complete = False
+    # Stopping early leaves the rest of the body unread, so only a fully read connection is kept
+    release_connection(key, s, keep_alive and complete)
+    filtered_complete = evaluator is not None and (complete or evaluator.done)
+    end_body(evaluator)
+    if page is not None:
+        page.finish(filtered_complete if evaluator is not None else complete)
+
+    if writer is not None:
+        writer.commit(complete, filtered_complete)
+        debug_write(b"--- Response Cached ---\r\n")
+
+
+def send_head(status_line, header_lines):
+    """Send the status line, and the headers if enabled"""
+    settings = current_state()
+    transport_write(status_line + BIN_CRLF)
+    if settings["framing"] == "LENGTH":
+        # Always one header frame, empty with HDRS_OFF
+        head = BIN_CRLF.join(header_lines) + BIN_CRLF if settings["send_headers"] else b""
+        frame_write(framing.header(len(head)) + head)
+        debug_write(b"--- Header Frame Sent ---\r\n")
+    elif settings["send_headers"]:
         debug_write(b"--- Sending Headers ---\r\n")
         transport_write(SOH)
-        transport_write(resp_headers + BIN_CRLF)
+        transport_write(BIN_CRLF.join(header_lines) + BIN_CRLF)
         debug_write(b"--- Headers Sent ---\r\n")
     else:
         debug_write(b"--- Skipping Headers ---\r\n")
 
-    # Collect remaining body
-    while remainingLength > 0:
-        recvLength = min(4096, remainingLength)
-        chunk = s.recv(recvLength)
-        remainingLength -= len(chunk)
-        body += chunk
-    s.close()
+
+def frame_write(data):
+    """transport_write for the framed part of a response, stuffed under FLOW X"""
+    # A MUX channel's output is stuffed whole as it is sent, see mux_write
+    if state["flow"] == "X" and mux.current() is None:
+        data = framing.stuff(data)
+    transport_write(data)
+
+
+def current_body_encoder():
+    """The encoder of the body being sent by the running task"""
+    channel = mux.current()
+    return channel.encoder if channel is not None else body_encoder
+
+
+def set_body_encoder(encoder):
+    global body_encoder
+    channel = mux.current()
+    if channel is not None:
+        channel.encoder = encoder
+    else:
+        body_encoder = encoder
+
+
+def open_body(window=None):
+    """
+    Start the body and return the function body bytes are written with.
+    With a window only its page of what is written reaches the client.
+    """
+    framed = current_state()["framing"] == "LENGTH"
+    if not framed:
+        transport_write(STX)
+        debug_write(b"--- STX Sent ---\r\n")
+    write = frame_write if framed else transport_write
+    if current_state()["compress"]:
+        # LZSS output is already length framed
+        import lzss
+        encoder = lzss.Encoder(write)
+    elif framed:
+        encoder = framing.Framer(write)
+    else:
+        encoder = None
+    if encoder is not None:
+        set_body_encoder(encoder)
+        write = encoder.feed
+    return window.wrap(write) if window is not None else write
 
 
-    # Apply JSONPath filter if set and response is JSON
-    if state["jsonpath"] and content_type and "application/json" in content_type:
+def start_body(content_type, window=None):
+    """
+    Start the body and return (sink, evaluator) for it. JSON bodies go
+    through the JSONPath evaluator when a filter is set, evaluator is None
+    otherwise.
+    """
+    out = open_body(window)
+    if filter_applies(content_type):
+        # Evaluate the JSONPath as the document arrives, only the result is sent
+        debug_write(b"--- Streaming JSONPath ---\r\n")
+        import jsonpath
+        evaluator = jsonpath.JsonPathStream(current_state()["jsonpath"], out)
+        if window is not None:
+            window.source = evaluator
+
+        def feed(data):
+            started = time.ticks_us()
+            evaluator.feed(data)
+            stats.record("jsonpath", started)
+
+        return feed, evaluator
+    debug_write(b"--- Streaming Body ---\r\n")
+    return out, None
+
+
+def end_body(evaluator):
+    """Complete the body and end the response"""
+    if evaluator is not None:
         try:
-            json_data = json.loads(body.decode())
-            filtered = apply_jsonpath(json_data, state["jsonpath"])
-            body = json.dumps(filtered).encode('ascii',)
-            debug_write(b"--- JSONPath Applied ---\r\n")
-            debug_write(body + b"\n")
-        except Exception as e:
+            evaluator.finish()
+        except ValueError as e:
             debug_write(f"\r\n--- JSONPath Error: {e} ---\r\n".encode())
-            body = b""  # Clear body on JSON parsing error
-
-    # send body
-    debug_write(b"--- Sending Body ---\r\n")
-    transport_write(STX)
-    debug_write(b"--- STX Sent ---\r\n")
-    transport_write(body)
+    encoder = current_body_encoder()
+    if encoder is not None:
+        encoder.finish()
+        set_body_encoder(None)
+    if encoder is not None and not isinstance(encoder, framing.Framer):
+        raw, sent = encoder.raw, encoder.sent
+        compress_stats["last_raw"] = raw
+        compress_stats["last_sent"] = sent
+        compress_stats["raw"] += raw
+        compress_stats["sent"] += sent
+        if log.level >= log.DEBUG:
+            debug_write(f"\r\n--- Compressed {raw} -> {sent} bytes ({ratio(raw, sent)}) ---\r\n".encode())
+    if current_state()["framing"] == "LENGTH":
+        # The end of body frame is all the client waits for
+        debug_write(b"--- Body Sent ---\r\n")
+        return
     transport_write(BIN_DOUBLE_CRLF)
     debug_write(b"--- Body Sent ---\r\n")
     transport_write(EOT)
     debug_write(b"--- EOT Sent ---\r\n")
 
 
+def ratio(raw, sent):
+    return f"{sent * 100 // raw}%" if raw else "-"
+
+
+def filter_applies(content_type):
+    return current_state()["jsonpath"] is not None and content_type and "application/json" in content_type
+
+
+def cache_can_serve(entry):
+    """True if the entry holds the body, or the result of the current JSONPath"""
+    if entry.has_body():
+        return True
+    return filter_applies(entry.content_type) and current_state()["jsonpath_expr"] in entry.filtered
+
+
+def send_cached(entry, revalidated=False, window=None):
+    """Answer from a cache entry"""
+    if window is not None:
+        window.begin(entry.status_line, entry.headers)
+    send_head(entry.status_line, entry.headers)
+    filtered = None
+    if filter_applies(entry.content_type):
+        filtered = entry.filtered.get(current_state()["jsonpath_expr"])
+    response_cache.hit(entry, revalidated, filtered is not None)
+
+    if filtered is not None:
+        # Already filtered and serialized, nothing to parse
+        debug_write(b"--- Cached JSONPath Result ---\r\n")
+        open_body(window)(filtered)
+        end_body(None)
+        if window is not None:
+            window.finish(True)
+        return
+
+    sink, evaluator = start_body(entry.content_type, window)
+    result = None
+    if evaluator is not None:
+        result = bytearray()
+        downstream = evaluator.sink
+
+        def output(data):
+            result.extend(data)
+            downstream(data)
+        evaluator.sink = output
+    try:
+        for chunk in entry.chunks(recv_buf):
+            sink(chunk)
+            if evaluator is not None and evaluator.done:
+                break
+        complete = True
+    except ValueError as e:
+        debug_write(f"\r\n--- JSONPath Error: {e} ---\r\n".encode())
+        result = None
+        complete = False
+    end_body(evaluator)
+    if window is not None:
+        window.finish(complete)
+    if result is not None:
+        response_cache.store_filtered(entry, current_state()["jsonpath_expr"], result)
+
+
+def send_page(window):
+    """Answer NEXT from the body kept for the last page"""
+    send_head(window.status_line, window.headers)
+    if log.level >= log.DEBUG:
+        debug_write(f"--- Page {window.offset} From Spool ---\r\n".encode())
+    out = open_body()
+    for chunk in window.spool.read(window.offset, window.end(), recv_buf):
+        out(chunk)
+    end_body(None)
+
+
+# ------------------------
+# Batch Mode
+# ------------------------
+#
+# BATCH is followed by requests and control commands, then END. They are
+# read in one go and answered in order, each answer followed by RS. Runs of
+# consecutive requests are started together, so their servers work at the
+# same time. Each request waits for its Turn before sending anything, which
+# keeps the answers in order.
+
+HTTP_METHODS = ("GET", "POST", "PUT", "DELETE", "HEAD", "OPTIONS", "TRACE", "CONNECT", "PATCH")
+MAX_BATCH = 16          # Items in one batch
+BATCH_CONCURRENCY = 3   # Requests in progress at once, each may hold a TLS session
+
+class Turn:
+    """Holds back a batched request's output until the ones before it are sent"""
+
+    def __init__(self):
+        self.go = asyncio.Event()
+        self.error = None
+
+    async def wait(self):
+        await self.go.wait()
+
+async def run_request(method, path, headers, body, turn=None, window=None):
+    page = current_state()["window"]
+    if window is None and page is not None:
+        window = paging.Window(*page, (method, path, headers, body))
+    stats.begin(method, path)
+    try:
+        await send_http(method, path, headers, body, turn=turn, window=window)
+    except ValueError as e:
+        # Bad request format
+        request_error(turn, "400", str(e))
+    except Exception as e:
+        sys.print_exception(e)
+        request_error(turn, "500", str(e))
+    if window is not None:
+        paging.keep(window)
+    stats.end()
+
+async def send_next():
+    """NEXT: the page after the last one sent"""
+    if paging.last is None:
+        slapi_error("400", "No response to page through")
+        return
+    last = paging.last
+    if last.total is not None and last.end() >= last.total:
+        slapi_error("400", "No more pages")
+        return
+    window = last.next()
+    if window.spool is not None:
+        send_page(window)
+        paging.keep(window)
+    elif window.request[0] == "GET":
+        # The page isn't kept, ask the server again
+        await run_request(*window.request, window=window)
+    else:
+        slapi_error("400", "Page no longer held")
+
+async def run_command(line):
+    """Handle a control command, NEXT may need to go to the server"""
+    if line == "NEXT":
+        await send_next()
+    else:
+        handle_command(line)
+
+def read_batch():
+    """
+    Read the items of a batch up to END. Returns a list of
+    ("http", (method, path, headers, body)), ("command", line) or ("error", msg).
+    """
+    items = []
+    while True:
+        line = readline()
+        if line == "END":
+            return items
+        if not line:
+            continue
+        method = line.split(" ", 1)[0]
+        if method in HTTP_METHODS:
+            try:
+                method, path, _ = line.split(" ", 2)
+                headers, body = read_http_request(line, method)
+                item = ("http", (method, path, headers, body))
+            except ValueError as e:
+                item = ("error", str(e))
+        elif method == "BATCH":
+            item = ("error", "BATCH cannot be nested")
+        else:
+            item = ("command", line)
+        if len(items) == MAX_BATCH:
+            item = ("error", "Too many BATCH items")
+        items.append(item)
+
+async def run_requests(requests):
+    """Run consecutive batched requests, up to BATCH_CONCURRENCY at a time, answering in order"""
+    turns = [Turn() for _ in requests]
+    tasks = []
+
+    def start(i):
+        tasks.append(asyncio.create_task(run_request(*requests[i], turn=turns[i])))
+
+    for i in range(min(BATCH_CONCURRENCY, len(requests))):
+        start(i)
+    for i, turn in enumerate(turns):
+        turn.go.set()
+        await tasks[i]
+        if turn.error is not None:
+            slapi_error(*turn.error)
+        transport_write(RS)
+        if len(tasks) < len(requests):
+            start(len(tasks))
+
+async def run_batch(items):
+    i = 0
+    while i < len(items):
+        kind, arg = items[i]
+        if kind == "http":
+            end = i
+            while end < len(items) and items[end][0] == "http":
+                end += 1
+            await run_requests([item[1] for item in items[i:end]])
+            i = end
+            continue
+        if kind == "command":
+            await run_command(arg)
+        else:
+            slapi_error("400", arg)
+        transport_write(RS)
+        i += 1
+    ok()
+
+
+# ------------------------
+# Multiplexed Channels
+# ------------------------
+
+BODY_METHODS = ("POST", "PUT", "PATCH")
+MUX_POLL_MS = 5     # How often the frame reader looks for input when idle
+
+def take_item(channel):
+    """Remove the next complete command or request from channel.lines, None if there isn't one yet"""
+    lines = channel.lines
+    while lines and lines[0] == "":
+        lines.pop(0)
+    if not lines:
+        return None
+    first = lines[0]
+    method = first.split(" ", 1)[0]
+    if method not in HTTP_METHODS:
+        lines.pop(0)
+        return ("command", first)
+    # Headers end at a blank line, and a body at the next one
+    blanks = 2 if method in BODY_METHODS else 1
+    end = 0
+    while blanks:
+        end += 1
+        if end == len(lines):
+            return None
+        if lines[end] == "":
+            blanks -= 1
+    request = iter(lines[1:end + 1])
+    del lines[:end + 1]
+    try:
+        method, path, _ = first.split(" ", 2)
+        headers, body = read_http_request(first, method, lambda: next(request))
+    except ValueError as e:
+        return ("error", str(e))
+    return ("http", (method, path, headers, body))
+
+async def mux_write(data):
+    """transport.awrite for MUX frames, stuffed under FLOW X like framed responses"""
+    if state["flow"] == "X":
+        data = framing.stuff(data)
+    await transport.awrite(data)
+
+async def run_channel(channel):
+    """Handle a channel's items in order, each answer ended by an empty frame"""
+    try:
+        while channel.items:
+            kind, arg = channel.items.pop(0)
+            if kind == "http":
+                await run_request(*arg)
+            elif kind == "command" and arg == "BATCH":
+                slapi_error("400", "BATCH is not available with MUX")
+            elif kind == "command":
+                await run_command(arg)
+            else:
+                slapi_error("400", arg)
+            await channel.flush(mux_write)
+            await channel.end(mux_write)
+    finally:
+        mux.routes.pop(channel.task, None)
+        channel.task = None
+
+async def serve_mux():
+    """Read frames from the client and run each channel until MUX OFF and every channel is done"""
+    global rx_pos, rx_len
+    reader = mux.FrameReader()
+    # The client stuffs its frames under FLOW X, as the proxy does
+    unstuffer = framing.Unstuffer() if state["flow"] == "X" else None
+    channels = {}
+    # Frames may have arrived with the MUX ON line
+    data = bytes(rx_view[rx_pos:rx_len])
+    rx_pos = rx_len = 0
+    while state["mux"] or mux.routes:
+        if not data:
+            n = transport.readinto(rx_view)
+            if not n:
+                await asyncio.sleep_ms(MUX_POLL_MS)
+                continue
+            data = bytes(rx_view[:n])
+        if unstuffer is not None:
+            data = unstuffer.feed(data)
+        for cid, payload in reader.feed(data):
+            if cid >= mux.MAX_CHANNELS or not state["mux"]:
+                continue
+            channel = channels.get(cid)
+            if channel is None:
+                channel = channels[cid] = mux.Channel(cid, channel_state())
+            channel.feed(payload)
+            item = take_item(channel)
+            while item is not None:
+                channel.items.append(item)
+                item = take_item(channel)
+            if channel.items and channel.task is None:
+                channel.task = asyncio.create_task(run_channel(channel))
+                mux.routes[channel.task] = channel
+        data = b""
+        await asyncio.sleep_ms(0)
+
+
 # ------------------------
 # Main Loop
 # ------------------------
 
-def start_slapi():
+async def run_prefetch(job):
+    """Refresh a PREFETCH job with the settings it was registered with"""
+    global link_muted
+    keys = ("domain", "jsonpath", "jsonpath_expr", "use_ssl", "default_headers", "compress")
+    saved = [state[k] for k in keys]
+    state["domain"] = job.domain
+    state["jsonpath"], state["jsonpath_expr"] = job.steps, job.expr
+    state["use_ssl"], state["default_headers"] = job.use_ssl, job.headers
+    state["compress"] = None
+    started = time.ticks_ms()
+    link_muted = True
+    debug_write(f"\r\n--- Prefetching {job.domain}{job.path} ---\r\n".encode())
+    try:
+        await send_http("GET", job.path, {}, b"", job=job)
+    except Exception as e:
+        sys.print_exception(e)
+    finally:
+        link_muted = False
+        for k, v in zip(keys, saved):
+            state[k] = v
+    entry = response_cache.peek(job.key) if job.key is not None else None
+    prefetch.finished(job, entry is not None and time.ticks_diff(entry.updated, started) >= 0)
+
+async def next_line():
+    """readline, running PREFETCH jobs that fall due while the client is quiet"""
+    while rx_pos == rx_len and not transport.any():
+        job = prefetch.due() if response_cache.enabled and wifi.connected() else None
+        if job is not None:
+            await run_prefetch(job)
+        else:
+            await asyncio.sleep_ms(IDLE_POLL_MS)
+    return readline()
+
+def start_slapi(ssid=None, password=None):
+    """Serve the client, joining Wi-Fi in the background when given an SSID"""
+    asyncio.run(serve(ssid, password))
 
-    global transport
+async def join_wifi(ssid, password):
+    await wifi.connect_background(ssid, password)
+    stats.mark("wifi")
+    if log.level >= log.INFO:
+        print(stats.boot_line(), file=sys.stderr)
+
+async def serve(ssid=None, password=None):
+    """
+    Handle commands and requests from the client. Requests run one at a
+    time, the event loop lets each response download while the link drains.
+    READY is sent before Wi-Fi is up, requests wait for it to connect.
+    """
+    global transport, wifi_task
 
     # Send start header to show we are here:
-    print("SLAPI/1.0 READY", file=sys.stderr)
+    if log.level >= log.INFO:
+        print("SLAPI/1.0 READY", file=sys.stderr)
     transport_write(b"SLAPI/1.0 READY\r\n")
+    stats.mark("ready")
+    if ssid is not None:
+        wifi_task = asyncio.create_task(join_wifi(ssid, password))
     
     while True:
         transport.set_read_mode()
-        print('<= ',end='', file=sys.stderr)
+        if log.level >= log.INFO:
+            print('<= ',end='', file=sys.stderr)
         time.sleep_ms(100)  # Give other end a chance to change direction
-        line = readline()
+        line = await next_line()
         if not line:
             continue
 
         method = line.split(" ", 1)[0]
 
-        if method in (
-            "GET","POST","PUT","DELETE","HEAD",
-            "OPTIONS","TRACE","CONNECT","PATCH"
-        ):
+        if method in HTTP_METHODS:
             try:
                 method, path, _ = line.split(" ", 2)
                 headers, body = read_http_request(line, method)
-                transport.set_write_mode()                  # prevent spurious gpio valid lines
-                time.sleep_ms(100)  # Give other end a chance to change direction
-                print('=> ',end='', file=sys.stderr)
-                send_http(method, path, headers, body)
             except ValueError as e:
                 # Bad request format
                 slapi_error("400", str(e))
-            except Exception as e:
-                sys.print_exception(e)
-                slapi_error("500", str(e))
+                continue
+            transport.set_write_mode()                  # prevent spurious gpio valid lines
+            time.sleep_ms(100)  # Give other end a chance to change direction
+            if log.level >= log.INFO:
+                print('=> ',end='', file=sys.stderr)
+            await run_request(method, path, headers, body)
+        elif line == "BATCH":
+            # All items are read before the link changes direction, once
+            items = read_batch()
+            transport.set_write_mode()                  # prevent spurious gpio valid lines
+            time.sleep_ms(100)  # Give other end a chance to change direction
+            if log.level >= log.INFO:
+                print('=> ',end='', file=sys.stderr)
+            await run_batch(items)
         else:
             transport.set_write_mode()                  # prevent spurious gpio valid lines
             time.sleep_ms(100)  # Give other end a chance to change direction
-            print('=> ',end='', file=sys.stderr)
-            handle_command(line)
+            if log.level >= log.INFO:
+                print('=> ',end='', file=sys.stderr)
+            await run_command(line)
+            if state["mux"]:
+                await serve_mux()
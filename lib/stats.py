@@ -0,0 +1,156 @@
+# MicroPython imports
+import asyncio
+import gc
+import sys
+import time
+
+# ------------------------
+# Request Instrumentation
+# ------------------------
+#
+# Timings of each stage of a request and counts of the bytes moved, for the
+# STATS command. A stage keeps its count, total, min and max microseconds, so
+# timing one is two ticks_us calls and a few additions. The heap is sampled
+# at the points it is likely to be fullest, gc.mem_free walks the heap so it
+# isn't called per chunk.
+
+# Stage names in the order STATS lists them
+STAGES = (
+    "dns",          # Resolving the host, cache hits included
+    "connect",      # TCP connect
+    "tls",          # TLS handshake, made as the request is sent
+    "wait",         # Request sent to status line received
+    "download",     # Headers received to the end of the body
+    "jsonpath",     # Evaluating the filter over the body
+    "link_write",   # Writing the link
+    "link_read",    # Reading the link, reads that returned data
+)
+
+# stage -> [count, total_us, min_us, max_us]
+_timings = {}
+counters = {"requests": 0, "upstream_in": 0, "link_in": 0, "link_out": 0}
+heap_free_low = None    # Least free heap seen
+heap_used_high = 0      # Most heap allocated seen
+
+# (phase, ticks_ms) in the order the phases were reached. ticks_ms counts from
+# reset, so each is the time from power up
+boot = []
+
+# STATS LOG ON: a line on stderr for each request
+log = False
+# Task -> Request, only kept while logging
+_requests = {}
+
+
+class Request:
+    """The stages and bytes of one request, for its log line"""
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started = time.ticks_us()
+        self.stages = {}
+        self.upstream_in = 0
+        self.link_out = 0
+
+
+def _current():
+    return _requests.get(asyncio.current_task()) if _requests else None
+
+
+def record(stage, started):
+    """Add the time since started (ticks_us) to stage. Returns now, to start the next"""
+    now = time.ticks_us()
+    us = time.ticks_diff(now, started)
+    t = _timings.get(stage)
+    if t is None:
+        _timings[stage] = [1, us, us, us]
+    else:
+        t[0] += 1
+        t[1] += us
+        if us < t[2]:
+            t[2] = us
+        if us > t[3]:
+            t[3] = us
+    request = _current()
+    if request is not None:
+        request.stages[stage] = request.stages.get(stage, 0) + us
+    return now
+
+
+def count(name, n):
+    """Add n bytes to a counter"""
+    counters[name] += n
+    request = _current()
+    if request is not None and name in ("upstream_in", "link_out"):
+        setattr(request, name, getattr(request, name) + n)
+
+
+def sample_heap():
+    global heap_free_low, heap_used_high
+    free = gc.mem_free()
+    used = gc.mem_alloc()
+    if heap_free_low is None or free < heap_free_low:
+        heap_free_low = free
+    if used > heap_used_high:
+        heap_used_high = used
+
+
+def begin(method, path):
+    counters["requests"] += 1
+    if log:
+        _requests[asyncio.current_task()] = Request(method, path)
+
+
+def end():
+    """Finish the running task's request, logging it when STATS LOG is on"""
+    sample_heap()
+    request = _requests.pop(asyncio.current_task(), None) if _requests else None
+    if request is None:
+        return
+    took = time.ticks_diff(time.ticks_us(), request.started)
+    stages = " ".join(f"{s}={request.stages[s]}us" for s in STAGES if s in request.stages)
+    print(
+        f"STATS {request.method} {request.path} {took}us {stages} "
+        f"in={request.upstream_in} out={request.link_out}",
+        file=sys.stderr,
+    )
+
+
+def set_log(on):
+    global log
+    log = on
+    if not on:
+        _requests.clear()
+
+
+def mark(phase):
+    """Note the time a boot phase was reached"""
+    boot.append((phase, time.ticks_ms()))
+
+
+def boot_line():
+    return "boot " + " ".join(f"{phase}={ms}ms" for phase, ms in boot)
+
+
+def reset():
+    global heap_free_low, heap_used_high
+    _timings.clear()
+    for name in counters:
+        counters[name] = 0
+    heap_free_low = None
+    heap_used_high = 0
+
+
+def report():
+    """Lines for the STATS command"""
+    lines = [" ".join(f"{k}={v}" for k, v in counters.items())]
+    for stage in STAGES:
+        t = _timings.get(stage)
+        if t is not None:
+            lines.append(f"{stage} n={t[0]} min={t[2]}us avg={t[1] // t[0]}us max={t[3]}us")
+    low = "-" if heap_free_low is None else heap_free_low
+    lines.append(f"heap free_low={low} used_high={heap_used_high}")
+    if boot:
+        lines.append(boot_line())
+    return lines
@@ -1,11 +1,54 @@
 
+# MicroPython imports
+import asyncio
+
+XON = 0x11
+XOFF = 0x13
+AWRITE_CHUNK = 64  # Bytes written between yields to other tasks
+
+
 class Transport:
     """Base transport interface."""
 
+    full_duplex = False  # Can receive while sending, needed for MUX
+    xonxoff = False
+    paused = False  # Set while the client has sent XOFF
+
+    def set_flow(self, xonxoff):
+        """Enable or disable XON/XOFF flow control from the client."""
+        self.xonxoff = xonxoff
+        self.paused = False
+
+    def _filter_flow(self, buf, n):
+        """
+        Act on any XON/XOFF in the first n bytes of buf and remove them.
+        Returns the number of data bytes left.
+        """
+        if not self.xonxoff:
+            return n
+        j = 0
+        for i in range(n):
+            b = buf[i]
+            if b == XOFF:
+                self.paused = True
+            elif b == XON:
+                self.paused = False
+            else:
+                buf[j] = b
+                j += 1
+        return j
+
     def set_write_mode(self):
         """Set transport to write mode (if supported)."""
         pass
 
+    def any(self):
+        """
+        True if input from the client is waiting. Transports that can't tell
+        always return True, so reads are never delayed.
+        """
+        return True
+
     def set_read_mode(self):
         """Set transport to read mode (if supported)."""
         pass
@@ -16,6 +59,33 @@ class Transport:
     def read(self, size=1):
         raise NotImplementedError()
 
+    def write_from(self, buf):
+        """Write all of buf without copying it. Returns the number of bytes written."""
+        view = memoryview(buf)
+        pos = 0
+        while pos < len(view):
+            pos += self.write(view[pos:]) or 0
+        return pos
+
+    async def awrite(self, buf):
+        """As write_from, yielding to other tasks between pieces of buf."""
+        view = memoryview(buf)
+        for pos in range(0, len(view), AWRITE_CHUNK):
+            self.write_from(view[pos:pos + AWRITE_CHUNK])
+            await asyncio.sleep_ms(0)
+        return len(view)
+
+    def readinto(self, buf):
+        """
+        Read up to len(buf) bytes into buf. Returns the number of bytes read,
+        0 if nothing was available.
+        """
+        data = self.read(len(buf))
+        if not data:
+            return 0
+        buf[:len(data)] = data
+        return self._filter_flow(buf, len(data))
+
     def init(self, **kwargs):
         """Reconfigure transport (if supported)."""
         pass
@@ -1,43 +1,52 @@
-import time
+import asyncio
 import network
 from machine import Pin
 
+POLL_MS = 250   # How often the background connection checks the link
+
 wlan= network.WLAN(network.STA_IF)
 led = Pin("LED", Pin.OUT)
 
-def reset_connection():
-    global wlan 
+async def reset_connection():
     wlan.active(False)
-    time.sleep(1)
+    await asyncio.sleep_ms(1000)
     wlan.active(True)
 
-def connect_wifi(ssid, password, max_wait=0):
-
-    global wlan
-    wait = max_wait
-    reset_connection()
-    
+async def connect_background(ssid, password):
+    """
+    Connect to ssid as a task, so the proxy can answer the client while
+    Wi-Fi associates. Retries until connected.
+    """
+    await reset_connection()
     print('Connecting to network...', ssid)
     print('Using password:', password[:2] + '*' * (len(password) - 2))
     wlan.connect(ssid, password)
-
-    # Wait for connect or fail after some retries if max_wait is set
-    while wait == 0 or max_wait > 0:
-        led.value(1)
-        if wlan.status() >= 3:
-            break
+    blink = 0
+    while not wlan.isconnected():
         if wlan.status() < 0:
             print('Wifi connection failed ' + str(wlan.status()) + ', retrying in 5 seconds...')
-            time.sleep(5)
-            reset_connection()
+            await asyncio.sleep_ms(5000)
+            await reset_connection()
             wlan.connect(ssid, password)
-        max_wait -= 1
-        print('waiting for wifi connection...')
-        time.sleep(1)
-        led.value(0)
+        blink ^= 1
+        led.value(blink)
+        await asyncio.sleep_ms(POLL_MS)
 
     print('connected')
     status = wlan.ifconfig()
     print( 'ip = ' + status[0] )
     led.value(1)
     return status
+
+def connected():
+    return wlan.isconnected()
+
+async def wait_connected(timeout_ms):
+    """True once Wi-Fi is connected, False if it isn't within timeout_ms"""
+    waited = 0
+    while not connected():
+        if waited >= timeout_ms:
+            return False
+        await asyncio.sleep_ms(POLL_MS)
+        waited += POLL_MS
+    return True